@@ -0,0 +1,149 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+
+from physics import G, _field
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+THETA = 0.5     # Opening angle, 0 is exact all-pairs, bigger is faster and rougher.
+LEAF_SIZE = 32  # Bodies per leaf before a cell is split into octants.
+MAX_DEPTH = 48  # Stops splitting on bodies sitting on top of each other.
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class Octree :
+
+    def __init__(self, positions, masses, leaf_size=LEAF_SIZE) :
+
+        self.positions = positions
+        self.masses = masses
+        self.leaf_size = leaf_size
+
+        # one entry per cell
+        self.centres = []
+        self.sizes = []
+        self.node_masses = []
+        self.coms = []
+        self.children = []
+        self.leaves = []
+
+        if len(masses) == 0 :
+            return
+
+        low = positions.min(axis=0)
+        high = positions.max(axis=0)
+        size = (high - low).max() * 1.0001
+        if size == 0 :
+            size = 1.0
+
+        self._build(np.arange(len(masses)), (low + high) / 2, size, 0)
+
+        self.centres = np.array(self.centres)
+        self.sizes = np.array(self.sizes)
+        self.node_masses = np.array(self.node_masses)
+        self.coms = np.array(self.coms)
+
+    def _build(self, indices, centre, size, depth) :
+
+        node = len(self.sizes)
+        mass = self.masses[indices].sum()
+
+        self.centres.append(centre)
+        self.sizes.append(size)
+        self.node_masses.append(mass)
+        if mass > 0 :
+            self.coms.append((self.masses[indices,np.newaxis] * self.positions[indices]).sum(axis=0) / mass)
+        else :
+            self.coms.append(centre)
+        self.children.append([])
+        self.leaves.append(None)
+
+        if len(indices) <= self.leaf_size or depth >= MAX_DEPTH :
+            self.leaves[node] = indices
+            return node
+
+        points = self.positions[indices]
+        octants = (points[:,0] > centre[0]) | (points[:,1] > centre[1]) << 1 | (points[:,2] > centre[2]) << 2
+
+        order = np.argsort(octants, kind='stable')
+        counts = np.bincount(octants, minlength=8)
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        for octant in range(8) :
+            if counts[octant] == 0 :
+                continue
+
+            shift = np.array([octant & 1, octant >> 1 & 1, octant >> 2 & 1]) - 0.5
+            child = self._build(indices[order[bounds[octant]:bounds[octant+1]]], centre + shift * size/2, size/2, depth+1)
+            self.children[node].append(child)
+
+        return node
+
+    def field(self, targets, theta=THETA, potential=False, softening=0) : # * Acceleration at each target, walked once per cell with every target that reached it.
+
+        accelerations = np.zeros((len(targets),3), dtype=np.float64)
+        potentials = np.zeros(len(targets), dtype=np.float64)
+        self.interactions = 0
+
+        if len(self.sizes) == 0 :
+            return (accelerations, potentials) if potential else accelerations
+
+        stack = [(0, np.arange(len(targets)))]
+
+        while stack :
+
+            node, group = stack.pop()
+
+            if self.node_masses[node] == 0 :
+                continue
+
+            separation = self.coms[node] - targets[group]
+            distance = np.sqrt(np.einsum('ij,ij->i', separation, separation))
+            inside = np.all(np.abs(targets[group] - self.centres[node]) <= self.sizes[node]/2, axis=1)
+
+            far = (self.sizes[node] < theta * distance) & ~inside
+
+            if far.any() :
+                softened = np.sqrt(distance[far]**2 + softening**2)
+                accelerations[group[far]] += G * self.node_masses[node] * separation[far] / softened[:,np.newaxis]**3
+                if potential :
+                    potentials[group[far]] -= G * self.node_masses[node] / softened
+                self.interactions += np.count_nonzero(far)
+
+            group = group[~far]
+
+            if len(group) == 0 :
+                continue
+
+            if self.leaves[node] is not None :
+                members = self.leaves[node]
+                if potential :
+                    leaf_accelerations, leaf_potentials = _field(targets[group], self.positions[members], self.masses[members], True, softening)
+                    accelerations[group] += leaf_accelerations
+                    potentials[group] += leaf_potentials
+                else :
+                    accelerations[group] += _field(targets[group], self.positions[members], self.masses[members], softening=softening)
+                self.interactions += len(group) * len(members)
+            else :
+                for child in self.children[node] :
+                    stack.append((child, group))
+
+        return (accelerations, potentials) if potential else accelerations
+
+class BarnesHut : # * Drop-in replacement for physics._accelerations, tree is rebuilt on every call.
+
+    def __init__(self, theta=THETA, leaf_size=LEAF_SIZE, softening=0) :
+
+        self.theta = theta
+        self.leaf_size = leaf_size
+        self.softening = softening
+        self.interactions = 0
+
+    def __call__(self, positions, masses, active=None, potential=False) :
+
+        tree = Octree(positions, masses, self.leaf_size)
+        if active is None :
+            result = tree.field(positions, self.theta, potential, self.softening)
+        else :
+            result = tree.field(positions[active], self.theta, potential, self.softening)
+        self.interactions = tree.interactions
+
+        return result
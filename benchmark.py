@@ -0,0 +1,222 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+
+import numpy as np
+
+import main
+from physics import G, AU, INTEGRATORS, System, _accelerations, _energy
+from barneshut import BarnesHut
+from kernels import _accelerations_jit
+from fmm import FMM
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+SIZES = [10, 100, 1000, 10000, 100000]
+STEPS = 20          # steps per case, cut short once BUDGET seconds have passed
+BUDGET = 10         # seconds per case
+MAX_DIRECT = 20000  # largest N for all-pairs work (direct and jit gravity, energy)
+MAX_LEGACY = 200    # largest N for the per-Body loops in main.py
+
+LEGACY = {
+    'updateBodies' : (main.updateBodies, 1),
+    'updateBodiesLeapfrog' : (main.updateBodiesLeapfrog, 2),
+    'updateBodiesRungeKutta' : (main.updateBodiesRungeKutta, 4),
+}
+
+GRAVITIES = {
+    'direct' : lambda : _accelerations,
+    'jit' : lambda : _accelerations_jit,
+    'barneshut' : lambda : BarnesHut(),
+    'fmm' : lambda : FMM(),
+}
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _commit() :
+
+    try :
+        return subprocess.run(['git','rev-parse','--short','HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError) :
+        return None
+
+def cloud(n, seed=0) : # * A sun with n-1 light bodies on near-circular, slightly inclined orbits between 0.4 and 40 AU.
+
+    rng = np.random.default_rng(seed)
+
+    radius = rng.uniform(0.4, 40, n-1) * AU
+    phase = rng.uniform(0, 2*np.pi, n-1)
+    tilt = rng.normal(0, 0.02, n-1)
+
+    positions = np.zeros((n,3))
+    positions[1:,0] = radius * np.cos(phase)
+    positions[1:,1] = radius * np.sin(phase)
+    positions[1:,2] = radius * tilt
+
+    speed = np.sqrt(G * 1.98892e30 / radius)
+
+    velocities = np.zeros((n,3))
+    velocities[1:,0] = -speed * np.sin(phase)
+    velocities[1:,1] = speed * np.cos(phase)
+
+    masses = np.concatenate(([1.98892e30], 10 ** rng.uniform(20, 25, n-1)))
+
+    return positions, velocities, masses
+
+def _bodies(positions, velocities, masses) :
+    return [main.Body(main.WHITE, 1, position.copy(), velocity.copy(), mass, '', [''], ['']) for position, velocity, mass in zip(positions, velocities, masses)]
+
+def _solarsystem() :
+
+    random.seed(0)
+    bodies , asteroids = main.init()
+
+    return bodies, asteroids
+
+def _result(name, integrator, gravity, n, steps, elapsed, evaluations, drift, particles=0) :
+
+    return {
+        'case' : name,
+        'integrator' : integrator,
+        'gravity' : gravity,
+        'n' : n,
+        'particles' : particles,
+        'steps' : steps,
+        'seconds' : elapsed,
+        'steps_per_second' : steps / elapsed,
+        'evaluations_per_second' : evaluations / elapsed,
+        'energy_drift' : drift,
+    }
+
+def benchmarkLegacy(bodies, update, cost, steps=STEPS, budget=BUDGET) :
+
+    n = len(bodies)
+    masses = np.array([body.mass for body in bodies])
+
+    def energy() :
+        return _energy(np.array([body.position for body in bodies], dtype=np.float64), np.array([body.velocity for body in bodies], dtype=np.float64), masses)
+
+    e0 = energy()
+
+    done = 0
+    start = time.perf_counter()
+    while done < steps and (done == 0 or time.perf_counter() - start < budget) :
+        update(bodies)
+        done += 1
+    elapsed = time.perf_counter() - start
+
+    return done, elapsed, done * cost * n, abs(energy() / e0 - 1)
+
+def benchmarkSystem(system, update, acceleration, dt, steps=STEPS, budget=BUDGET, energy=True) :
+
+    system.linked = False
+    if system.particles is not None :
+        system.particles.linked = False
+
+    if energy :
+        e0 = _energy(system.positions, system.velocities, system.masses)
+
+    acceleration(system.positions, system.masses) # warm-up, the jit kernels compile or load from the cache on their first call
+    acceleration(system.positions, system.masses, np.arange(len(system)) % 2 == 0) # and the active-row kernel the block integrator uses
+
+    done = 0
+    start = time.perf_counter()
+    while done < steps and (done == 0 or time.perf_counter() - start < budget) :
+        update(system, dt, acceleration)
+        done += 1
+    elapsed = time.perf_counter() - start
+
+    drift = None
+    if energy :
+        drift = abs(_energy(system.positions, system.velocities, system.masses) / e0 - 1)
+
+    evaluations = system.evaluations
+    if system.particles is not None : # each particle feeling the massive bodies is one more evaluation
+        evaluations += system.particles.evaluations
+
+    return done, elapsed, evaluations, drift
+
+def run(sizes=SIZES, steps=STEPS, budget=BUDGET, max_direct=MAX_DIRECT, max_legacy=MAX_LEGACY) :
+
+    results = []
+
+    def report(result) :
+        drift = 'n/a' if result['energy_drift'] is None else f"{result['energy_drift']:.3e}"
+        print(f"{result['case']:>21} {result['integrator']:>24} {result['gravity']:>10} N={result['n']:<7} {result['steps_per_second']:10.2f} steps/s {result['evaluations_per_second']:14.0f} evals/s drift {drift}")
+        results.append(result)
+
+    cases = [('solarsystem', None, False), ('solarsystem+particles', None, True)] + [(f'cloud{n}', n, False) for n in sizes] # the legacy loops only move bodies, so they are only compared without particles
+
+    for name, n, particles in cases :
+
+        dt = main.TIMESKIP
+
+        if n is None :
+            n = len(_solarsystem()[0])
+            arrays = None
+        else :
+            arrays = cloud(n)
+
+        if n <= max_legacy and not particles :
+            for integrator, (update, cost) in LEGACY.items() :
+                legacy = _bodies(*arrays) if arrays is not None else _solarsystem()[0]
+                report(_result(name, integrator, 'direct', n, *benchmarkLegacy(legacy, update, cost, steps, budget)))
+
+        for integrator, update in INTEGRATORS.items() :
+            for gravity, provider in GRAVITIES.items() :
+
+                if n > max_direct and gravity not in ('barneshut','fmm') :
+                    continue
+
+                if arrays is None :
+                    bodies , asteroids = _solarsystem()
+                    system = System(bodies, asteroids if particles else None)
+                else :
+                    system = System.from_arrays(*arrays)
+
+                count = 0 if system.particles is None else len(system.particles)
+                report(_result(name, integrator, gravity, n, *benchmarkSystem(system, update, provider(), dt, steps, budget, n <= max_direct), count))
+
+    return {
+        'commit' : _commit(),
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'machine' : platform.machine(),
+        'results' : results,
+    }
+
+def compare(current, baseline) : # Prints steps/s of each case against a saved run.
+
+    previous = {(r['case'], r['integrator'], r['gravity']) : r for r in baseline['results']}
+
+    print(f"\nagainst {baseline.get('commit')} :")
+
+    for result in current['results'] :
+        key = (result['case'], result['integrator'], result['gravity'])
+        if key in previous :
+            ratio = result['steps_per_second'] / previous[key]['steps_per_second']
+            print(f"{key[0]:>21} {key[1]:>24} {key[2]:>10} x{ratio:.2f}")
+
+# Main --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__' :
+
+    parser = argparse.ArgumentParser(description='Benchmark the integrators and gravity backends')
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES, help='N for the synthetic clouds')
+    parser.add_argument('--steps', type=int, default=STEPS)
+    parser.add_argument('--budget', type=float, default=BUDGET, help='seconds per case before it is cut short')
+    parser.add_argument('--max-direct', type=int, default=MAX_DIRECT)
+    parser.add_argument('--max-legacy', type=int, default=MAX_LEGACY)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help='earlier benchmark JSON to compare against')
+    args = parser.parse_args()
+
+    current = run(args.sizes, args.steps, args.budget, args.max_direct, args.max_legacy)
+
+    with open(args.output, 'w') as file :
+        json.dump(current, file, indent=4)
+
+    if args.compare :
+        with open(args.compare) as file :
+            compare(current, json.load(file))
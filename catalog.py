@@ -0,0 +1,126 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import csv
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from physics import AU, System, _groups
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+COLUMNS = ['name', 'mass', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'r', 'g', 'b', 'radius', 'parents', 'sons'] # positions in AU, velocities in m/s
+
+CACHE = '.cache.npz' # binary copy kept beside the source, rebuilt whenever the source changes
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _split(text) :
+    return [name for name in text.split(';') if name] or ['']
+
+def _readCsv(path) :
+
+    with open(path, newline='') as file :
+        rows = [row for row in csv.reader(line for line in file if not line.startswith('#'))]
+
+    header = rows[0]
+    columns = {name : [row[header.index(name)] for row in rows[1:]] for name in COLUMNS}
+
+    return columns
+
+def _readJson(path) : # [{"name": .., "mass": .., "position": [x,y,z], "velocity": [..], "color": [r,g,b], "radius": .., "parents": [..], "sons": [..]}, ...]
+
+    with open(path) as file :
+        entries = json.load(file)
+
+    columns = {
+        'name' : [entry.get('name', '') for entry in entries],
+        'mass' : [entry['mass'] for entry in entries],
+        'radius' : [entry.get('radius', 1) for entry in entries],
+        'parents' : [';'.join(entry.get('parents', [])) for entry in entries],
+        'sons' : [';'.join(entry.get('sons', [])) for entry in entries],
+    }
+
+    for i,axis in enumerate('xyz') :
+        columns[axis] = [entry['position'][i] for entry in entries]
+        columns['v' + axis] = [entry['velocity'][i] for entry in entries]
+
+    for i,channel in enumerate('rgb') :
+        columns[channel] = [entry.get('color', [255,255,255])[i] for entry in entries]
+
+    return columns
+
+def _arrays(columns) :
+
+    return {
+        'names' : np.array(columns['name'], dtype=str),
+        'masses' : np.array(columns['mass'], dtype=np.float64),
+        'positions' : np.array([columns['x'], columns['y'], columns['z']], dtype=np.float64).T * AU,
+        'velocities' : np.array([columns['vx'], columns['vy'], columns['vz']], dtype=np.float64).T,
+        'colors' : np.array([columns['r'], columns['g'], columns['b']], dtype=np.float64).T.astype(int),
+        'radii' : np.array(columns['radius'], dtype=np.float64),
+        'parents' : np.array(columns['parents'], dtype=str),
+        'sons' : np.array(columns['sons'], dtype=str),
+    }
+
+def load_catalog(path) : # * Reads a .csv or .json catalog straight into arrays, later loads come from the binary cache.
+
+    stat = os.stat(path)
+    key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cache = path + CACHE
+
+    if os.path.exists(cache) :
+        try :
+            with np.load(cache) as data :
+                if np.array_equal(data['key'], key) :
+                    return Catalog({name : data[name] for name in data.files if name != 'key'})
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) : # truncated or corrupt cache, parse the source and write it again
+            pass
+
+    if path.endswith('.json') :
+        arrays = _arrays(_readJson(path))
+    else :
+        arrays = _arrays(_readCsv(path))
+
+    temporary = cache + '.tmp'
+    try :
+        with open(temporary, 'wb') as file :
+            np.savez(file, key=key, **arrays)
+        os.replace(temporary, cache) # renamed into place so an interrupted write never leaves half a cache
+    except OSError : # read-only catalog directory, just parse every time
+        if os.path.exists(temporary) :
+            os.remove(temporary)
+
+    return Catalog(arrays)
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class Catalog : # * Column arrays for every object, row i is one body.
+
+    def __init__(self, arrays) :
+
+        self.names = arrays['names']
+        self.masses = arrays['masses']
+        self.positions = arrays['positions'].reshape(-1,3)
+        self.velocities = arrays['velocities'].reshape(-1,3)
+        self.colors = arrays['colors'].reshape(-1,3)
+        self.radii = arrays['radii']
+        self.parents = arrays['parents']
+        self.sons = arrays['sons']
+
+    def __len__(self) :
+        return len(self.masses)
+
+    def family(self, i) : # (parents, sons) lists in the shape Body takes them.
+        return _split(str(self.parents[i])), _split(str(self.sons[i]))
+
+    def system(self) : # Bare System for headless runs, massless rows ride along as test particles.
+
+        massive = self.masses > 0
+
+        system = System.from_arrays(self.positions[massive], self.velocities[massive], self.masses[massive])
+
+        if not massive.all() :
+            system.particles = System.from_arrays(self.positions[~massive], self.velocities[~massive], self.masses[~massive])
+
+        system.groups = _groups([str(name) for name in self.names[massive]], [_split(str(parents))[0] for parents in self.parents[massive]])
+
+        return system
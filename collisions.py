@@ -0,0 +1,172 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+
+from physics import AU, _touching
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+ENCOUNTER = 0.001 * AU  # pairs closer than this are a close encounter, inside the moon's orbit so the solar system starts clear
+DENSITY = 3000          # kg/m^3, turns a mass into a physical radius for contact
+SUBSTEPS = 16           # pieces a step is cut into while a close encounter is in progress
+RESPONSES = ['log', 'merge', 'subcycle']
+
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _radii(masses, density=DENSITY) : # Radius of a uniform sphere of the given density.
+    return np.cbrt(3 * masses / (4 * np.pi * density))
+
+def _candidates(positions, size) : # * Spatial hash on a uniform grid of cell size, every pair sharing or touching a cell comes back once as i < j.
+
+    if len(positions) < 2 :
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    size = max(size, np.ptp(positions, axis=0).max() / 2**20) # keeps the packed keys inside int64
+
+    return _touching(np.floor(positions / size).astype(np.int64))
+
+def _regroup(groups, gone) : # Satellite groups renumbered after the rows in gone were removed, groups that lost their parent or every son are dropped.
+
+    shift = lambda rows : rows - np.searchsorted(gone, rows)
+
+    regrouped = []
+    for parent, sons in groups :
+        sons = sons[~np.isin(sons, gone)]
+        if parent not in gone and len(sons) :
+            regrouped.append((int(shift(parent)), shift(sons)))
+
+    return regrouped
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class Collisions : # * Broad phase on a spatial hash each step, then log, merge or subcycle through close encounters and contacts.
+
+    def __init__(self, response='log', encounter=ENCOUNTER, density=DENSITY, substeps=SUBSTEPS, path=None) :
+
+        if response not in RESPONSES :
+            raise ValueError(f'response must be one of {RESPONSES} , not {response!r}')
+
+        self.response = response
+        self.encounter = encounter
+        self.density = density
+        self.substeps = substeps
+
+        self.events = []
+        self.approaching = set() # pairs inside the encounter distance at the last check, so each approach is logged once
+        self.touching = set() # pairs in contact at the last check, so each collision is logged once
+        self.encounters = None # from the last check, decides whether the next step is subcycled
+
+        self.file = None
+        if path is not None :
+            self.file = open(path, 'w')
+            self.file.write('time,kind,first,second,distance\n')
+
+    def detect(self, system) : # (i, j, distance) of pairs inside the encounter distance and of pairs in contact.
+
+        radii = _radii(system.masses, self.density)
+        reach = max(self.encounter, 2 * radii.max(initial=0))
+
+        i, j = _candidates(system.positions, reach)
+        distances = np.linalg.norm(system.positions[j] - system.positions[i], axis=1)
+
+        close = distances < self.encounter
+        contact = distances < radii[i] + radii[j]
+
+        return (i[close], j[close], distances[close]), (i[contact], j[contact], distances[contact])
+
+    def _name(self, system, i) :
+        return system.bodies[i].name if len(system.bodies) == len(system) else str(i)
+
+    def _log(self, system, kind, i, j, distance) :
+
+        event = {'time' : system.time, 'kind' : kind, 'pair' : [self._name(system, i), self._name(system, j)], 'distance' : float(distance)}
+        self.events.append(event)
+
+        if self.file is not None :
+            self.file.write(f"{event['time']!r},{kind},{event['pair'][0]},{event['pair'][1]},{event['distance']!r}\n")
+            self.file.flush()
+
+    def check(self, system) : # Logs encounters and contacts as they begin, returns all of them for the response.
+
+        encounters, contacts = self.detect(system)
+
+        approaching = set(zip(encounters[0].tolist(), encounters[1].tolist()))
+        for i, j, distance in zip(*encounters) :
+            if (i, j) not in self.approaching :
+                self._log(system, 'encounter', i, j, distance)
+        self.approaching = approaching
+        self.encounters = encounters
+
+        touching = set(zip(contacts[0].tolist(), contacts[1].tolist()))
+        for i, j, distance in zip(*contacts) :
+            if (i, j) not in self.touching :
+                self._log(system, 'collision', i, j, distance)
+        self.touching = touching
+
+        return encounters, contacts
+
+    def merge(self, system, contacts) : # * Perfectly inelastic mergers, the heavier body keeps its row and takes the mass, momentum and centre of mass of both.
+
+        i, j, distances = contacts
+        gone = set()
+
+        for k in np.argsort(distances) :
+
+            a, b = int(i[k]), int(j[k])
+            if a in gone or b in gone :
+                continue
+
+            keep, drop = (a, b) if system.masses[a] >= system.masses[b] else (b, a)
+            mass = system.masses[keep] + system.masses[drop]
+
+            system.positions[keep] = (system.masses[keep] * system.positions[keep] + system.masses[drop] * system.positions[drop]) / mass
+            system.velocities[keep] = (system.masses[keep] * system.velocities[keep] + system.masses[drop] * system.velocities[drop]) / mass
+            system.masses[keep] = mass
+
+            self._log(system, 'merge', keep, drop, distances[k])
+            gone.add(drop)
+
+        if not gone :
+            return
+
+        gone = sorted(gone)
+
+        if len(system.bodies) == len(system) :
+            for row in reversed(gone) :
+                del system.bodies[row]
+
+        system.positions = np.delete(system.positions, gone, axis=0)
+        system.velocities = np.delete(system.velocities, gone, axis=0)
+        system.masses = np.delete(system.masses, gone)
+        system.levels = np.delete(system.levels, gone)
+        system.groups = _regroup(system.groups, gone)
+        system.accelerations = None # forces changed, the next step starts fresh
+        system.work = {}
+        system.bind()
+
+        self.encounters, contacts = self.detect(system) # rows were renumbered, pairs already approaching or touching stay quiet
+        self.approaching = set(zip(self.encounters[0].tolist(), self.encounters[1].tolist()))
+        self.touching = set(zip(contacts[0].tolist(), contacts[1].tolist()))
+
+    def step(self, system, dt, update, acceleration) : # * One step of update with the chosen response wrapped around it.
+
+        if self.encounters is None :
+            self.check(system)
+
+        if self.response == 'subcycle' and len(self.encounters[0]) :
+
+            steps = system.steps
+            for k in range(self.substeps) :
+                update(system, dt / self.substeps, acceleration)
+                encounters, contacts = self.check(system)
+            system.steps = steps + 1 # counters outside still see one step
+
+        else :
+            update(system, dt, acceleration)
+            encounters, contacts = self.check(system)
+
+        if self.response == 'merge' and len(contacts[0]) :
+            self.merge(system, contacts)
+
+    def close(self) :
+
+        if self.file is not None :
+            self.file.close()
+            self.file = None
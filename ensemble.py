@@ -0,0 +1,162 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+from physics import AU, YEAR, INTEGRATORS, System, _energy
+from main import TIMESKIP, GRAVITY, THETA, SOFTENING, ORDER, init, _gravity
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+ENCOUNTER = 0.01 * AU   # pairs closer than this that started farther apart count as a close encounter
+CHECK_EVERY = 1         # steps between encounter checks
+
+BASE = None # read-only starting state, handed to each worker once by the pool initializer
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _base(system) : # Plain arrays of the starting state, cheap to send to a worker and free of Body objects.
+
+    base = {
+        'names' : [body.name for body in system.bodies] if len(system.bodies) == len(system) else [''] * len(system),
+        'positions' : system.positions.copy(),
+        'velocities' : system.velocities.copy(),
+        'masses' : system.masses.copy(),
+        'groups' : system.groups,
+        'particles' : None,
+    }
+
+    if system.particles is not None :
+        base['particles'] = (system.particles.positions.copy(), system.particles.velocities.copy(), system.particles.masses.copy())
+
+    return base
+
+def _share(base) :
+
+    global BASE
+    BASE = base
+
+def _separations(positions) : # Distance between every pair i < j.
+
+    i, j = np.triu_indices(len(positions), 1)
+
+    return i, j, np.linalg.norm(positions[j] - positions[i], axis=1)
+
+def _system(base, perturbation) : # * Fresh System from the shared base with the perturbation applied.
+
+    system = System.from_arrays(base['positions'], base['velocities'], base['masses'])
+    system.groups = base['groups']
+
+    if base['particles'] is not None and perturbation.get('particles', True) :
+        system.particles = System.from_arrays(*base['particles'])
+
+    names = base['names']
+
+    for name, factor in perturbation.get('masses', {}).items() :
+        system.masses[names.index(name)] *= factor
+
+    for name, change in perturbation.get('velocities', {}).items() :
+        system.velocities[names.index(name)] += change
+
+    for name, change in perturbation.get('positions', {}).items() : # AU
+        system.positions[names.index(name)] += np.asarray(change) * AU
+
+    return system
+
+def _run(task) : # * One member of the ensemble, runs in a worker against the shared BASE.
+
+    index, perturbation, years, encounter, check_every = task
+
+    system = _system(BASE, perturbation)
+
+    dt = perturbation.get('dt', TIMESKIP)
+    update = INTEGRATORS[perturbation.get('integrator', 'leapfrog')]
+    softening = perturbation.get('softening', SOFTENING)
+    acceleration = _gravity(perturbation.get('gravity', GRAVITY), perturbation.get('theta', THETA), softening, perturbation.get('order', ORDER))
+
+    e0 = _energy(system.positions, system.velocities, system.masses, softening) # the Hamiltonian the run actually integrates
+
+    i, j, separations = _separations(system.positions)
+    outside = separations >= encounter # pairs that start inside (planet and moon) are not encounters
+    closest = separations.copy()
+    encounters = []
+
+    steps = int(round(years * YEAR / dt))
+
+    start = time.perf_counter()
+    for step in range(steps) :
+
+        update(system, dt, acceleration)
+
+        if system.steps % check_every == 0 :
+
+            separations = _separations(system.positions)[2]
+            closest = np.minimum(closest, separations)
+
+            close = outside & (separations < encounter)
+            for k in np.flatnonzero(close) :
+                encounters.append({'pair' : [BASE['names'][i[k]], BASE['names'][j[k]]], 'time' : system.time, 'distance' : float(separations[k])})
+            outside &= ~close # logged once, when the pair first comes in
+
+    elapsed = time.perf_counter() - start
+
+    return {
+        'index' : index,
+        'perturbation' : perturbation,
+        'steps' : steps,
+        'seconds' : elapsed,
+        'time' : system.time,
+        'positions' : system.positions.tolist(),
+        'velocities' : system.velocities.tolist(),
+        'energy_drift' : abs(_energy(system.positions, system.velocities, system.masses, softening) / e0 - 1),
+        'closest' : float(closest.min()) if len(closest) else None,
+        'encounters' : encounters,
+    }
+
+def run_ensemble(system, perturbations, years=1, processes=None, encounter=ENCOUNTER, check_every=CHECK_EVERY) : # * Every perturbation of system run headless in a process pool, results come back in the order given.
+
+    base = _base(system)
+    tasks = [(index, perturbation, years, encounter, check_every) for index, perturbation in enumerate(perturbations)]
+
+    with multiprocessing.Pool(processes, initializer=_share, initargs=(base,)) as pool :
+        results = pool.map(_run, tasks, chunksize=1)
+
+    return sorted(results, key=lambda result : result['index'])
+
+def sweep(name=None, factors=(), dts=(), **common) : # Perturbations for the usual questions, mass factors on one body and/or a list of step sizes.
+
+    perturbations = [dict(common, masses={name : factor}) for factor in factors]
+    perturbations += [dict(common, dt=dt) for dt in dts]
+
+    return perturbations or [dict(common)]
+
+# Main --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__' :
+
+    parser = argparse.ArgumentParser(description='Run perturbed copies of the solar system in parallel')
+    parser.add_argument('--body', help='body whose mass is scaled')
+    parser.add_argument('--factors', type=float, nargs='*', default=[], help='mass factors for --body')
+    parser.add_argument('--dts', type=float, nargs='*', default=[], help='step sizes in seconds to sweep')
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='leapfrog')
+    parser.add_argument('--gravity', choices=['direct','jit','barneshut','fmm'], default=GRAVITY)
+    parser.add_argument('--no-particles', action='store_true', help='leave the asteroids out')
+    parser.add_argument('--processes', type=int, help='worker count, all cores by default')
+    parser.add_argument('--encounter', type=float, default=ENCOUNTER / AU, help='close-encounter distance in AU')
+    parser.add_argument('--output', default='ensemble.json')
+    args = parser.parse_args()
+
+    bodies , asteroids = init()
+    system = System(bodies, asteroids)
+    system.linked = False
+
+    perturbations = sweep(args.body, args.factors, args.dts, integrator=args.integrator, gravity=args.gravity, particles=not args.no_particles)
+    results = run_ensemble(system, perturbations, args.years, args.processes, args.encounter * AU)
+
+    for result in results :
+        closest = 'n/a' if result['closest'] is None else f"{result['closest'] / AU:.5f} AU" # a lone body has no pair to measure
+        print(f"{json.dumps(result['perturbation']):<60} drift {result['energy_drift']:.3e} closest {closest} {len(result['encounters'])} encounters {result['seconds']:.2f} s")
+
+    with open(args.output, 'w') as file :
+        json.dump(results, file, indent=4)
@@ -0,0 +1,343 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import argparse
+import itertools
+
+import numpy as np
+
+from physics import G, _field, _touching
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+ORDER = 6           # Taylor order p of the expansions, the error falls roughly geometrically with p and M2L work grows as p^6.
+LEAF_SIZE = 32      # Bodies the average body shares its leaf with, picks the depth.
+MAX_LEVEL = 10      # 2^10 cells a side, keeps the packed keys small.
+DIRECT = 16         # Heaviest bodies summed directly onto every row, a star or giant planet is never left to a truncated expansion.
+SAMPLE = 64         # Rows checked against direct summation by validation.
+PAIR_CHUNK = 1 << 20 # Near-field pairs held in memory at once.
+
+SEPARATION = 2      # Neighbour cells on each side summed directly. On the 5000-body benchmark cloud p=6 with 2 gives worst 6e-5 / rms 8e-7 relative error,
+                    # against 3e-3 / 5e-5 for p=4 with 1 (about Barnes-Hut at theta 0.5), which runs about 4x faster. Drop both for speed when the error can take it.
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _well_separated(separation) : # Offsets to the children of the parent's neighbours that are not neighbours themselves.
+
+    reach = 2 * separation + 1
+    return np.array([offset for offset in itertools.product(range(-reach,reach+1), repeat=3) if max(map(abs, offset)) > separation])
+
+def _multi_indices(order) : # (t,u,v) with t+u+v <= order, lowest total first.
+    return np.array([(t, u, s-t-u) for s in range(order+1) for t in range(s,-1,-1) for u in range(s-t,-1,-1)])
+
+def _monomials(d, indices, order) : # d^n / n! for every multi-index n, one row per vector.
+
+    powers = np.ones((len(d), order+1, 3))
+    for q in range(1, order+1) :
+        powers[:,q] = powers[:,q-1] * d / q
+
+    return powers[:,indices[:,0],0] * powers[:,indices[:,1],1] * powers[:,indices[:,2],2]
+
+def _derivatives(r, indices, lookup, order) : # * Every derivative of 1/|r| up to order, by the Hermite recursion R^(j)_000 = (-1)^j (2j-1)!! / |r|^(2j+1) and R^(j)_(n+e) = n_e R^(j+1)_(n-e) + r_e R^(j+1)_n.
+
+    distance = np.sqrt(np.einsum('ij,ij->i', r, r))
+
+    R = np.zeros((order+1, len(indices), len(r)))
+    double = 1 # (2j-1)!!
+    for j in range(order+1) :
+        R[j,0] = (-1)**j * double / distance**(2*j+1)
+        double *= 2*j+1
+
+    for index in range(1, len(indices)) :
+
+        n = indices[index]
+        axis = np.flatnonzero(n)[0]
+        lower = n.copy()
+        lower[axis] -= 1
+        below = lookup[tuple(lower)]
+
+        for j in range(order+1 - n.sum()) :
+            R[j,index] = r[:,axis] * R[j+1,below]
+            if n[axis] > 1 :
+                lower[axis] -= 1
+                R[j,index] += (n[axis] - 1) * R[j+1,lookup[tuple(lower)]]
+                lower[axis] += 1
+
+    return R[0].T
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class FMM : # * Drop-in replacement for physics._accelerations, fast multipole on a uniform octree with Cartesian Taylor expansions, rebuilt on every call.
+
+    def __init__(self, order=ORDER, leaf_size=LEAF_SIZE, softening=0, validate=0, sample=SAMPLE, separation=SEPARATION, direct=DIRECT) :
+
+        self.order = order
+        self.leaf_size = leaf_size
+        self.separation = separation
+        self.direct = direct
+        self.offsets = _well_separated(separation)
+        self.softening = softening # near field only, the expansions are of the bare 1/r
+        self.validate = validate # calls between checks against direct summation, 0 never checks
+        self.sample = sample
+
+        self.calls = 0
+        self.interactions = 0
+        self.errors = [] # (call, worst, rms) relative acceleration error of each check
+
+        indices = _multi_indices(order)
+        lookup = {tuple(n) : k for k, n in enumerate(indices)}
+        totals = indices.sum(axis=1)
+        size = len(indices)
+
+        self.indices = indices
+        self.lookup = lookup
+        self.signs = (-1.0) ** totals
+
+        # M2L, L_k += sum_n (-1)^|n| M_n D_(n+k) over |n|+|k| <= p
+        self.sums = np.zeros((size,size), dtype=int)
+        self.sums_mask = np.zeros((size,size))
+        # M2M and L2L, moments and locals shifted by d^(n-k)/(n-k)! over k <= n
+        self.differences = np.zeros((size,size), dtype=int)
+        self.differences_mask = np.zeros((size,size))
+
+        for n, k in itertools.product(range(size), repeat=2) :
+            if totals[n] + totals[k] <= order :
+                self.sums[k,n] = lookup[tuple(indices[n] + indices[k])]
+                self.sums_mask[k,n] = 1
+            if np.all(indices[k] <= indices[n]) :
+                self.differences[n,k] = lookup[tuple(indices[n] - indices[k])]
+                self.differences_mask[n,k] = 1
+
+        # L2P gradient, d/dx_i picks L_(k+e_i)
+        self.gradients = np.zeros((3,size), dtype=int)
+        self.gradients_mask = np.zeros((3,size))
+        for axis, k in itertools.product(range(3), range(size)) :
+            if totals[k] < order :
+                self.gradients[axis,k] = lookup[tuple(indices[k] + np.eye(3, dtype=int)[axis])]
+                self.gradients_mask[axis,k] = 1
+
+    def __call__(self, positions, masses, active=None, potential=False) :
+
+        if active is not None :
+            active = np.arange(len(masses))[active] # row numbers whether a mask or indices came in
+
+        accelerations, potentials = self.field(positions, masses, active)
+        self.calls += 1
+
+        if self.validate and (self.calls - 1) % self.validate == 0 :
+            self.errors.append((self.calls,) + self.check(positions, masses, accelerations, rows=active))
+
+        if active is not None :
+            accelerations, potentials = accelerations[active], potentials[active]
+
+        return (accelerations, potentials) if potential else accelerations
+
+    def _shifts(self, level) : # M2M / L2L matrix for each octant, S[n,k] = d^(n-k)/(n-k)! with d the child centre less the parent centre.
+
+        octants = np.array([[octant & 1, octant >> 1 & 1, octant >> 2 & 1] for octant in range(8)])
+        monomials = _monomials((octants - 0.5) / 2**(level+1), self.indices, self.order)
+
+        return monomials[:,self.differences] * self.differences_mask
+
+    def field(self, positions, masses, active=None) : # Accelerations and potentials, of every row or only the active rows. The heaviest direct rows act by direct summation and sit in the tree as massless targets.
+
+        if self.direct == 0 :
+            return self._tree(positions, masses, active)
+
+        heavy = np.argsort(masses, kind='stable')[-self.direct:]
+        light = masses.copy()
+        light[heavy] = 0
+
+        accelerations, potentials = self._tree(positions, light, active)
+        interactions = self.interactions
+
+        rows = slice(None) if active is None else active
+        summed_accelerations, summed_potentials = _field(positions[rows], positions[heavy], masses[heavy], True, self.softening)
+        accelerations[rows] += summed_accelerations
+        potentials[rows] += summed_potentials
+        self.interactions = interactions + len(summed_potentials) * len(heavy)
+
+        return accelerations, potentials
+
+    def _tree(self, positions, masses, active=None) : # * P2M at the leaves, M2M up to level 2, M2L and L2L back down, L2P and P2P at the leaves. With active only those rows are filled in, the upward pass still takes every source.
+
+        n = len(masses)
+        accelerations = np.zeros((n,3), dtype=np.float64)
+        potentials = np.zeros(n, dtype=np.float64)
+        self.interactions = 0
+
+        if n == 0 or not masses.any() or (active is not None and len(active) == 0) : # nothing in the tree pulls, or nobody asked
+            return accelerations, potentials
+
+        low = positions.min(axis=0)
+        size = np.ptp(positions, axis=0).max() * 1.0001
+        if size == 0 :
+            size = 1.0
+
+        x = (positions - low) / size # unit box, the expansions stay well scaled whatever the units
+
+        def pack(coords, level) :
+            return (coords[:,0] << 2*level) | (coords[:,1] << level) | coords[:,2]
+
+        for depth in range(2, MAX_LEVEL+1) : # deep enough that the average body shares its leaf with leaf_size others, discs and clusters fill far fewer than 8^depth cells
+            cells = np.minimum((x * 2**depth).astype(np.int64), 2**depth - 1)
+            keys = pack(cells, depth)
+            if (np.unique(keys, return_counts=True)[1]**2).sum() <= self.leaf_size * n :
+                break
+
+        # tree, occupied cells only, keys sorted on every level
+        order = np.argsort(keys, kind='stable')
+        unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+        owner = np.empty(n, dtype=np.int64) # leaf of every body
+        owner[order] = np.repeat(np.arange(len(unique)), counts)
+
+        coords = {depth : cells[order[starts]]}
+        tables = {depth : unique}
+        parents = {}
+        for level in range(depth, 2, -1) :
+            up = coords[level] >> 1
+            tables[level-1], first, parents[level] = np.unique(pack(up, level-1), return_index=True, return_inverse=True)
+            coords[level-1] = up[first]
+
+        # cells holding an active body and their ancestors, the only ones the downward pass visits
+        needed = {depth : np.ones(len(unique), dtype=bool)}
+        if active is not None :
+            needed[depth][:] = False
+            needed[depth][owner[active]] = True
+        for level in range(depth, 2, -1) :
+            needed[level-1] = np.zeros(len(tables[level-1]), dtype=bool)
+            needed[level-1][parents[level][needed[level]]] = True
+
+        # P2M
+        centres = (coords[depth] + 0.5) / 2**depth
+        weighted = masses[:,np.newaxis] * _monomials(x - centres[owner], self.indices, self.order)
+        moments = {depth : np.add.reduceat(weighted[order], starts, axis=0)}
+
+        # M2M
+        for level in range(depth, 2, -1) :
+            shifts = self._shifts(level-1)
+            octants = coords[level] & 1
+            octants = octants[:,0] | octants[:,1] << 1 | octants[:,2] << 2
+            moments[level-1] = np.zeros((len(tables[level-1]), len(self.indices)))
+            for octant in range(8) :
+                rows = np.flatnonzero(octants == octant)
+                moments[level-1][parents[level][rows]] += moments[level][rows] @ shifts[octant].T # one child per octant, no repeated parents
+
+        # M2L and L2L
+        local = {}
+        for level in range(2, depth+1) :
+
+            local[level] = np.zeros((len(tables[level]), len(self.indices)))
+
+            if level > 2 :
+                shifts = self._shifts(level-1)
+                octants = coords[level] & 1
+                octants = octants[:,0] | octants[:,1] << 1 | octants[:,2] << 2
+                for octant in range(8) :
+                    rows = np.flatnonzero((octants == octant) & needed[level])
+                    local[level][rows] = local[level-1][parents[level][rows]] @ shifts[octant]
+
+            derivatives = _derivatives(-self.offsets / 2**level, self.indices, self.lookup, self.order)
+
+            rows = np.flatnonzero(needed[level])
+            targets = coords[level][rows]
+            count = 0
+
+            for offset, derivative in zip(self.offsets, derivatives) : # a target meets each offset once, so no repeated rows in the update
+
+                sources = targets + offset
+                valid = np.all((sources >= 0) & (sources < 2**level) & (np.abs((sources >> 1) - (targets >> 1)) <= self.separation), axis=1)
+
+                target = np.flatnonzero(valid)
+                wanted = pack(sources[target], level)
+                found = np.minimum(np.searchsorted(tables[level], wanted), len(tables[level]) - 1)
+                hit = tables[level][found] == wanted
+                if not hit.any() :
+                    continue
+
+                translation = derivative[self.sums] * self.sums_mask * self.signs # T[k,n]
+                local[level][rows[target[hit]]] += moments[level][found[hit]] @ translation.T
+                count += np.count_nonzero(hit)
+
+            self.interactions += count
+
+        # L2P
+        bodies = np.arange(n) if active is None else active
+        expansion = local[depth][owner[bodies]]
+        monomials = _monomials(x[bodies] - centres[owner[bodies]], self.indices, self.order)
+        far = np.zeros(n)
+        far[bodies] = np.einsum('ik,ik->i', expansion, monomials)
+        for axis in range(3) :
+            accelerations[bodies,axis] = np.einsum('ik,ik->i', expansion[:,self.gradients[axis]] * self.gradients_mask[axis], monomials)
+
+        # P2P with every body in the same or a neighbouring leaf, pairs with no active end are dropped
+        i, j = _touching(cells, self.separation)
+        if active is not None :
+            wanted = np.zeros(n, dtype=bool)
+            wanted[active] = True
+            keep = wanted[i] | wanted[j]
+            i, j = i[keep], j[keep]
+        epsilon = (self.softening / size)**2
+        near = np.zeros(n)
+
+        for start in range(0, len(i), PAIR_CHUNK) :
+
+            a = i[start:start+PAIR_CHUNK]
+            b = j[start:start+PAIR_CHUNK]
+
+            difference = x[b] - x[a]
+            square = np.einsum('ij,ij->i', difference, difference)
+            inverse = np.zeros(len(a))
+            np.divide(1, np.sqrt(square + epsilon), out=inverse, where=square > 0)
+            cube = inverse**3
+
+            for axis in range(3) :
+                accelerations[:,axis] += np.bincount(a, masses[b] * cube * difference[:,axis], n) - np.bincount(b, masses[a] * cube * difference[:,axis], n)
+            near += np.bincount(a, masses[b] * inverse, n) + np.bincount(b, masses[a] * inverse, n)
+
+        self.interactions += 2 * len(i)
+
+        accelerations *= G / size**2
+        potentials[:] = -G * (far + near) / size
+
+        return accelerations, potentials
+
+    def check(self, positions, masses, accelerations=None, sample=None, rows=None) : # Worst and rms relative acceleration error on a random sample of rows (of the given rows, if any) against direct summation.
+
+        if accelerations is None :
+            accelerations = self.field(positions, masses, rows)[0]
+
+        if rows is None :
+            rows = np.arange(len(masses))
+
+        rng = np.random.default_rng(self.calls)
+        rows = rng.choice(rows, min(sample or self.sample, len(rows)), replace=False)
+
+        exact = _field(positions[rows], positions, masses, softening=self.softening)
+        scale = np.linalg.norm(exact, axis=1)
+        errors = np.linalg.norm(accelerations[rows] - exact, axis=1) / np.where(scale > 0, scale, 1)
+
+        return float(errors.max()), float(np.sqrt(np.mean(errors**2)))
+
+# Main --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__' :
+
+    from benchmark import cloud
+    import time
+
+    parser = argparse.ArgumentParser(description='Check the fast multipole solver against direct summation')
+    parser.add_argument('--n', type=int, nargs='*', default=[1000, 10000])
+    parser.add_argument('--orders', type=int, nargs='*', default=[2, 4, 6, 8])
+    parser.add_argument('--sample', type=int, default=SAMPLE)
+    parser.add_argument('--separation', type=int, default=SEPARATION)
+    parser.add_argument('--direct', type=int, default=DIRECT)
+    args = parser.parse_args()
+
+    for n in args.n :
+
+        positions, velocities, masses = cloud(n)
+
+        for order in args.orders :
+
+            solver = FMM(order, separation=args.separation, direct=args.direct)
+            start = time.perf_counter()
+            accelerations = solver(positions, masses)
+            elapsed = time.perf_counter() - start
+
+            worst, rms = solver.check(positions, masses, accelerations, args.sample)
+            print(f'N={n:<7} p={order} {elapsed:7.3f} s worst {worst:.2e} rms {rms:.2e}')
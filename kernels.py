@@ -0,0 +1,93 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+
+from physics import G, _accelerations
+
+try :
+    import numba
+    from numba import njit, prange
+    NUMBA = True
+except ImportError : # pure NumPy from physics is used instead
+    NUMBA = False
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+if NUMBA :
+
+    @njit(parallel=True, cache=True)
+    def _pairs(positions, masses, g, threads, epsilon) : # * Each pair visited once and applied to both ends, every thread fills its own buffer so the writes never race.
+
+        n = len(masses)
+
+        accelerations = np.zeros((threads, n, 3))
+        potentials = np.zeros((threads, n))
+
+        for t in prange(threads) :
+            for i in range(t, n, threads) : # interleaved rows keep the triangle balanced across threads
+                for j in range(i + 1, n) :
+
+                    dx = positions[j,0] - positions[i,0]
+                    dy = positions[j,1] - positions[i,1]
+                    dz = positions[j,2] - positions[i,2]
+                    square = dx*dx + dy*dy + dz*dz
+
+                    if square == 0 :
+                        continue
+
+                    inverse = 1 / np.sqrt(square + epsilon)
+                    cube = inverse * inverse * inverse
+
+                    accelerations[t,i,0] += masses[j] * cube * dx
+                    accelerations[t,i,1] += masses[j] * cube * dy
+                    accelerations[t,i,2] += masses[j] * cube * dz
+
+                    accelerations[t,j,0] -= masses[i] * cube * dx
+                    accelerations[t,j,1] -= masses[i] * cube * dy
+                    accelerations[t,j,2] -= masses[i] * cube * dz
+
+                    potentials[t,i] -= masses[j] * inverse
+                    potentials[t,j] -= masses[i] * inverse
+
+        return g * accelerations.sum(axis=0), g * potentials.sum(axis=0)
+
+    @njit(parallel=True, cache=True)
+    def _targets(targets, sources, masses, g, epsilon) : # One thread per target, for when only some rows are wanted.
+
+        accelerations = np.zeros((len(targets), 3))
+        potentials = np.zeros(len(targets))
+
+        for i in prange(len(targets)) :
+            for j in range(len(sources)) :
+
+                dx = sources[j,0] - targets[i,0]
+                dy = sources[j,1] - targets[i,1]
+                dz = sources[j,2] - targets[i,2]
+                square = dx*dx + dy*dy + dz*dz
+
+                if square == 0 :
+                    continue
+
+                inverse = 1 / np.sqrt(square + epsilon)
+                cube = inverse * inverse * inverse
+
+                accelerations[i,0] += masses[j] * cube * dx
+                accelerations[i,1] += masses[j] * cube * dy
+                accelerations[i,2] += masses[j] * cube * dz
+
+                potentials[i] -= masses[j] * inverse
+
+        return g * accelerations, g * potentials
+
+def _accelerations_jit(positions, masses, active=None, potential=False, softening=0) : # * Same contract as physics._accelerations, compiled and threaded when Numba is installed.
+
+    if not NUMBA :
+        return _accelerations(positions, masses, active, potential, softening)
+
+    positions = np.ascontiguousarray(positions, dtype=np.float64)
+    masses = np.ascontiguousarray(masses, dtype=np.float64)
+
+    if active is None :
+        accelerations, potentials = _pairs(positions, masses, G, numba.get_num_threads(), softening**2)
+    else :
+        accelerations, potentials = _targets(np.ascontiguousarray(positions[active]), positions, masses, G, softening**2)
+
+    return (accelerations, potentials) if potential else accelerations
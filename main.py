@@ -1,15 +1,20 @@
 # Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
-import pygame as py 
-from pygame import gfxdraw as gfx
-from pygame import mixer 
 import time 
 import random
 import os 
 import numpy as np
 import math
-
-py.init()
-py.font.init()
+import collections
+import argparse
+import functools
+
+from physics import G, AU, YEAR, INTEGRATORS, System, updateSystemRungeKutta, updateSystemLeapfrog, updateSystemBlockTimestep, updateSystemKepler, updateSystemWisdomHolman, _accelerations, _accelerationsSingle
+from barneshut import BarnesHut
+from fmm import FMM, ORDER
+from monitor import Monitor, EVERY
+from snapshot import save_checkpoint, load_checkpoint, TrajectoryWriter, Trajectory
+from catalog import load_catalog
+from collisions import Collisions, ENCOUNTER, RESPONSES
 
 # Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
 WHITE = np.array([255, 255, 255])
@@ -27,34 +32,171 @@ BROWN = np.array([222,184,135])
 
 # Facts https://nssdc.gsfc.nasa.gov/planetary/planetfact.html , https://ssd.jpl.nasa.gov/tools/sbdb_lookup.html#/ , https://ssd.jpl.nasa.gov/horizons/app.html#/
 
+SOLAR_SYSTEM = os.path.join('Assets','solarsystem.csv')
+FOUR_BODY = os.path.join('Assets','fourbody.csv')
+
 WIDTH = 1080
 HEIGHT = 1080
 PADDING = 10
 FPS = 60
 TIMESKIP = (3.154e+7) * 1/(32*FPS)
 
-G = 6.67430e-11
-AU = 1.496e11
+TRAIL_LENGTH = 500 # orbit points kept per body
+
+CHECKPOINT = 'checkpoint.npz' # F5 saves, F9 loads
+CHECKPOINT_EVERY = 10000 # steps between checkpoints in a headless run
+
+SPEED = TIMESKIP * FPS # simulated seconds per wall second, [ and ] halve or double it
+MAX_SUBSTEPS = 256 # physics steps allowed per rendered frame before the sim falls behind real time
+
+GRAVITY = 'direct' # 'direct' all-pairs, 'jit' compiled all-pairs, 'barneshut' tree or 'fmm' fast multipole
+THETA = 0.5
+SOFTENING = 0 # Plummer length in metres, 0 is plain Newtonian gravity
+SINGLE = False # float32 forces in AU / day / solar-mass units, for runs that are only watched
+COMPENSATED = False # Kahan-summed position updates, keeps the drift of long runs down
 
 global SCALE
 SCALE = 200/AU
 
-particles = []
+PARTICLES = 4096 # exhaust particles alive at once, the oldest are recycled first
+EXHAUST_SPEED = 1000 # m/s, bodies faster than this shed particles while E is on
+SHRINK = 0.02 # pixels of radius lost per frame
+FADE = 1.5 # colour lost per channel per frame
+JITTER = 0.4 # pixels a particle wanders per frame
+
+MERGE = 1 # pixels, bodies sharing a cell this size on screen are drawn as the biggest of them
+TRAIL_STEP = 2 # pixels of trail on screen per drawn point
 
 X_AXIS = np.array([1,0,0])
 Y_AXIS = np.array([0,1,0])
 Z_AXIS = np.array([0,0,1])
 
-WINDOW = py.display.set_mode((WIDTH, HEIGHT))
-py.display.set_caption('Newtonian Simulator')
-ICON = py.image.load(os.path.join('Assets','icon.png'))
-py.display.set_icon(ICON)
-mixer.music.load(os.path.join('Assets','sunvoxSketchAugust.wav'))
-mixer.music.set_volume(0.2)
-mixer.music.play(-1)
-CLOCK = py.time.Clock()
+WINDOW = None # opened by setup(), headless runs never touch pygame
+CLOCK = None
+FONT = None
 
 # Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def setup() : # pygame is only imported here, headless runs never load the window, font or audio stack.
+
+    global py
+    global gfx
+    global mixer
+    global WINDOW
+    global CLOCK
+    global FONT
+
+    import pygame as py
+    from pygame import gfxdraw as gfx
+    from pygame import mixer
+
+    py.init()
+    py.font.init()
+
+    WINDOW = py.display.set_mode((WIDTH, HEIGHT))
+    py.display.set_caption('Newtonian Simulator')
+    ICON = py.image.load(os.path.join('Assets','icon.png'))
+    py.display.set_icon(ICON)
+    mixer.music.load(os.path.join('Assets','sunvoxSketchAugust.wav'))
+    mixer.music.set_volume(0.2)
+    mixer.music.play(-1)
+    CLOCK = py.time.Clock()
+    FONT = py.font.SysFont(None, 22)
+
+def draw_overlay(surface, lines) :
+
+    for i,line in enumerate(lines) :
+        surface.blit(FONT.render(line, True, WHITE), (PADDING, PADDING + i * 20))
+
+def draw_points(surface, positions, color, offset, center_offset) : # * Projects, culls and plots every point in one pass, each point is a small plus like a radius 1 circle.
+
+    screen = np.floor(positions[:,:2] * SCALE + (WIDTH/2 + offset[0] + center_offset[0], HEIGHT/2 + offset[1] + center_offset[1])).astype(int)
+
+    pixels = py.surfarray.pixels3d(surface)
+
+    for dx,dy in ((0,0),(1,0),(-1,0),(0,1),(0,-1)) :
+
+        x = screen[:,0] + dx
+        y = screen[:,1] + dy
+        visible = (x >= 0) & (x < WIDTH) & (y >= 0) & (y < HEIGHT)
+
+        pixels[x[visible],y[visible]] = color
+
+    del pixels # unlocks the surface
+
+def draw_bodies(surface, bodies, positions, radii, offset, center_offset) : # * Projects every body in one pass, culls what is off screen and draws only the biggest body in each MERGE pixel cell, so zooming out costs no more than zooming in.
+
+    origin = np.array((WIDTH/2 + offset[0] + center_offset[0], HEIGHT/2 + offset[1] + center_offset[1]))
+    screen = positions[:,:2] * SCALE + origin
+
+    visible = np.flatnonzero(np.all((screen > -radii[:,np.newaxis]) & (screen < (WIDTH,HEIGHT) + radii[:,np.newaxis]), axis=1))
+
+    cells = np.floor(screen[visible] / MERGE).astype(np.int64)
+    order = np.lexsort((-radii[visible], cells[:,1], cells[:,0])) # biggest body first within each cell
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = np.any(cells[order][1:] != cells[order][:-1], axis=1)
+
+    shown = visible[order[first]]
+    hidden = np.zeros(len(bodies), dtype=bool)
+    hidden[visible[order[~first]]] = True # sat under a bigger body, so would its trail
+
+    for body, skip in zip(bodies, hidden) :
+        if not skip :
+            body.draw_trail(surface, origin)
+
+    for i, point in zip(shown, np.floor(screen[shown]).astype(int).tolist()) :
+        bodies[i].draw(surface, point)
+
+def _interpolate(system, previous, alpha) : # Renderer trails the physics by alpha of a step, these are the blended rows to draw.
+    return previous + alpha * (system.positions - previous)
+
+def _replaySystem(trajectory) : # Bodies rebuilt from the trajectory header, the arrays get overwritten from disk every frame.
+
+    header = trajectory.header
+    first = trajectory.positions(0)
+
+    names = header.get('names', [''] * trajectory.bodies)
+    colors = header.get('colors', [WHITE.tolist()] * trajectory.bodies)
+    radii = header.get('radii', [1] * trajectory.bodies)
+
+    bodies = [Body(np.array(color), radius, first[i].copy(), np.array([1,0,0],dtype=np.float64), 0, name, [''], ['']) for i,(name,color,radius) in enumerate(zip(names, colors, radii))]
+
+    system = System(bodies)
+    system.particles = System.from_arrays(trajectory.particle_positions(0), np.zeros((trajectory.particles,3)), np.zeros(trajectory.particles))
+    system.particles.linked = False
+
+    return bodies, system
+
+def _gravity(gravity, theta, softening=SOFTENING, order=ORDER, validate=0, single=False) :
+
+    if single :
+        if gravity != 'direct' :
+            raise ValueError(f'single precision forces need direct gravity , not {gravity!r}')
+        return functools.partial(_accelerationsSingle, softening=softening)
+
+    if gravity == 'barneshut' :
+        return BarnesHut(theta, softening=softening)
+
+    if gravity == 'fmm' :
+        return FMM(order, softening=softening, validate=validate)
+
+    provider = _accelerations
+
+    if gravity == 'jit' :
+        from kernels import _accelerations_jit # Numba is slow to import, only pay for it when asked
+        provider = _accelerations_jit
+
+    if softening :
+        return functools.partial(provider, softening=softening)
+
+    return provider
+
+def _precision(system, single=SINGLE, compensated=COMPENSATED) : # Float32 particle forces and compensated position updates, the massive bodies get theirs from _gravity.
+
+    system.compensated = compensated
+    if system.particles is not None :
+        system.particles.single = single
+        system.particles.compensated = compensated
+
 def _magnitude(arr) :
     return np.sqrt(np.power(arr[0],2)+np.power(arr[1],2)+np.power(arr[2],2))
 
@@ -127,7 +269,7 @@ def updateBodies(bodies) : # * Working as intended , loses accuracy over time.
 
         body1.move()
 
-def updateBodiesLeapfrog(bodies): # * Working as intended (?) , terrible at bodies close to one another.
+def updateBodiesLeapfrog(bodies): # * Working as intended , the whole system is kicked and drifted together.
 
     for body1 in bodies : 
                                                                                                             
@@ -140,8 +282,12 @@ def updateBodiesLeapfrog(bodies): # * Working as intended (?) , terrible at bodi
 
         body1.halfvelocity = body1.velocity + (body1.force/body1.mass) * TIMESKIP / 2
 
+    for body1 in bodies :
+
         body1.position = body1.position + body1.halfvelocity * TIMESKIP
 
+    for body1 in bodies :
+
         body1.reset_force()
 
         for body2 in bodies :
@@ -152,8 +298,6 @@ def updateBodiesLeapfrog(bodies): # * Working as intended (?) , terrible at bodi
         body1.velocity = body1.halfvelocity + (body1.force/body1.mass) * TIMESKIP / 2   
 
         body1.orbit_points.append((body1.position[0],body1.position[1])) 
-        
-        # ! Possible the entire system needs to be integrated at once.
 
 def updateBodiesRungeKutta(bodies) : # * Working as intended , much better accuracy.
 
@@ -210,46 +354,21 @@ def f(t,Y) :
 
     return np.array(Yout,dtype=object)
 
-def init() :
+def init(catalog=SOLAR_SYSTEM) : # catalog=FOUR_BODY for the four body test
 
-    # Body(WHITE,1,np.array([],dtype=np.float64)*AU,np.array([],dtype=np.float64),9.3835e20, '', [''] , ['']) 
-    temp = []
-
-    sun = Body(YELLOW,2,np.array([-8.974133574359094E-03, -4.482427452346882E-04,  2.127030817970091E-04],dtype=np.float64)*AU,np.array([2.943740906566515E-00, -1.522269030106718E+01,  5.405294312927581E-02],dtype=np.float64),1.98892e30, 'sun', [''], ['mercury','venus','earth','mars','jupiter','saturn','uranus','neptune'])
-    
-    mercury = Body(GRAY,1,np.array([2.149048126431211E-01, -3.703275102221233E-01, -5.054911078568054E-02],dtype=np.float64)*AU,np.array([3.194733455939798E+04,  2.760819992651870E+04, -6.726501719165086E+02],dtype=np.float64),3.3e23, 'mercury', ['sun'] , [''])
-    
-    venus = Body(ORANGE,1,np.array([3.767586589387518E-01,  6.096285845914635E-01, -1.366913498677996E-02],dtype=np.float64)*AU,np.array([-2.970885187788254E+04,  1.854691206999238E+04,  1.969344555554133E+03],dtype=np.float64),4.8685e24, 'venus', ['sun'],[''])
-    
-    earth = Body(LIGHT_BLUE,1,np.array([-9.505921700191389E-01,  3.087952119351821E-01,  1.989011142050173E-04],dtype=np.float64)*AU,np.array([-9.765270895434471E+03, -2.842566374064967E+04,  1.340272026562062E-00],dtype=np.float64),5.9742e24, 'earth', ['sun'] , ['moon'])
-    moon = Body(GRAY,1,np.array([-9.516099449755469E-01,  3.112973301473198E-01,  4.330394864078491E-04],dtype=np.float64)*AU,np.array([-1.066377823007508E+04, -2.878353621791489E+04,  2.165227437387784E+01]),7.346e22, 'moon', ['earth'], [''])
-    
-    mars = Body(RED,1,np.array([-7.405291211708632E-01,  1.452944259261813E+00,  4.861778406962673E-02],dtype=np.float64)*AU,np.array([-2.072274803097698E+04, -8.848861397338558E+03,  3.233078954361095E+02],dtype=np.float64),6.39e23, 'mars', ['sun'] , [''])
-    
-    jupiter = Body(BROWN,1,np.array([4.704772918851717E+00,  1.511365399792853E+00, -1.115289067637071E-01],dtype=np.float64)*AU,np.array([-4.142495775785003E+03,  1.305304733174904E+04,  3.854785819752404E+01],dtype=np.float64),1.898e27, 'jupiter', ['sun'] , [''])
-    io = Body(WHITE,1,np.array([4.706938257216622E+00,  1.509572133786335E+00, -1.115594494192786E-01],dtype=np.float64)*AU,np.array([-1.230429875586250E+04,  1.402234469412938E+04, -3.975277505700525E+01],dtype=np.float64),8.9319e22, '', [''] , ['']) 
-    europa = Body(WHITE,1,np.array([4.702856385815596E+00,  1.515378255151747E+00, -1.114295295544017E-01],dtype=np.float64)*AU,np.array([-1.666930213080933E+04,  7.148065924326971E+03, -4.541115612813402E+02],dtype=np.float64),4.8e22, '', [''] , ['']) 
-    ganymede = Body(WHITE,1,np.array([4.703207226292632E+00,  1.518356168535199E+00, -1.112841464407621E-01],dtype=np.float64)*AU,np.array([-1.474354194458230E+04,  1.070435488535438E+04, -1.985930546699728E+02],dtype=np.float64),1.4819e23, '', [''] , ['']) 
-    callisto = Body(WHITE,1,np.array([4.706161799473352E+00,  1.523844362019054E+00, -1.111179037981445E-01],dtype=np.float64)*AU,np.array([-1.230429875586250E+04,  1.402234469412938E+04, -3.975277505700525E+01],dtype=np.float64),1.0759e23, '', [''] , ['']) 
-    
-    saturn = Body(BROWN,1,np.array([8.305195501443066E+00, -5.220660638189502E+00, -2.398939811841545E-01],dtype=np.float64)*AU,np.array([4.600536590796957E+03,  8.158326300996555E+03, -3.244831811891196E+02],dtype=np.float64),5.683e26, 'saturn', ['sun'] , [''])
-    titan = Body(WHITE,1,np.array([8.312856127498531E+00, -5.219148638165247E+00, -2.414370887995103E-01],dtype=np.float64)*AU,np.array([3.206448276258196E+03,  1.314094496673270E+04, -2.754997061373401E+03],dtype=np.float64),1.3452e23, '', [''] , ['']) 
-    
-    uranus = Body(BLUE,1,np.array([1.318193324076657E+01,  1.457795067541527E+01, -1.166313290118892E-01],dtype=np.float64)*AU,np.array([-5.100987027758054E+03,  4.250202813282490E+03,  8.207046388370087E+01],dtype=np.float64),8.6811e24, 'uranus', ['sun'] , [''])
+    table = load_catalog(catalog)
 
-    neptune = Body(BLUE,1,np.array([2.976877605000455E+01, -2.750966044048722E+00, -6.294024336722218E-01],dtype=np.float64)*AU,np.array([4.643812712803050E+02,  5.444339754400878E+03, -1.230818583920708E+02],dtype=np.float64),1.02409e26, 'neptune', ['sun'] , ['']) 
+    bodies = []
 
-    pluto = Body(GRAY,1,np.array([1.634165701841916E+01, -3.059305947768982E+01, -1.453331982012886E+00],dtype=np.float64)*AU,np.array([4.939775926882488E+03,  1.393967470123350E+03, -1.560052632054384E+03],dtype=np.float64),1.309e22, 'pluto', ['sun'] , [''])
+    for i in range(len(table)) :
 
-    ceres1 = Body(WHITE,1,np.array([-2.520166209594838E+00,  1.981777425761302E-01,  4.690652595690624E-01],dtype=np.float64)*AU,np.array([-2.087658705414134E+03, -1.918397099983357E+04, -2.209470431651512E+02],dtype=np.float64),9.3835e20, 'ceres', ['sun'] , ['']) 
+        parents, sons = table.family(i)
 
-    b0 = Body(WHITE,1,np.array([0,0,0],dtype=np.float64)*AU,np.array([0,0,0],dtype=np.float64),9.3835e27, '', [''] , ['']) 
-    b1 = Body(WHITE,1,np.array([0.364054665,0,0],dtype=np.float64)*AU,np.array([0,0.4662036850e3*7.25,0],dtype=np.float64),9.3835e27, '', [''] , ['']) 
-    b2 = Body(WHITE,1,np.array([-0.364054665,0,0],dtype=np.float64)*AU,np.array([0,-0.43236573e3*7.25,0],dtype=np.float64),9.3835e27, '', [''] , ['']) 
-    b3 = Body(WHITE,1,np.array([0,0.364054665,0],dtype=np.float64)*AU,np.array([-0.43236573e3*7.25,0,0],dtype=np.float64),9.3835e27, '', [''] , ['']) 
-    b4 = Body(WHITE,1,np.array([0,-0.364054665,0],dtype=np.float64)*AU,np.array([0.43236573e3*7.25,0,0],dtype=np.float64),9.3835e27, '', [''] , ['']) 
+        bodies.append(
+            Body(table.colors[i],table.radii[i],table.positions[i].copy(),table.velocities[i].copy(),table.masses[i], str(table.names[i]), parents, sons)
+        )
 
-    bodies = [sun,mercury,venus,moon,earth,mars,ganymede,callisto,jupiter,titan,saturn,uranus,neptune,pluto,ceres1] 
+    sun = max(bodies, key=lambda body : body.mass)
     
     asteroids = []
     
@@ -274,8 +393,11 @@ def init() :
         desired_length = random.randint(floor[0],ceiling[0]) / 100
         scaled_vec = [i * desired_length for i in normalized_vec]
 
+        # circular orbit about the sun
+        speed = np.sqrt(G * sun.mass / (desired_length * AU))
+
         asteroids.append(
-            Body(WHITE,1,np.array([scaled_vec[0],scaled_vec[1],0],dtype=np.float64)*AU,np.array([1,1,1],dtype=np.float64),0, '', [''] , ['']) 
+            Body(WHITE,1,np.array([scaled_vec[0],scaled_vec[1],0],dtype=np.float64)*AU + sun.position,np.array([-normalized_vec[1],normalized_vec[0],0],dtype=np.float64)*speed + sun.velocity,0, '', [''] , ['']) 
         )
         
     for i in range(2500) :
@@ -300,24 +422,28 @@ def init() :
         desired_length = random.randint(floor[0],ceiling[0]) / 10
         scaled_vec = [i * desired_length for i in normalized_vec]
 
+        speed = np.sqrt(G * sun.mass / (desired_length * AU))
+
         asteroids.append(
-            Body(WHITE,1,np.array([scaled_vec[0],scaled_vec[1],0],dtype=np.float64)*AU,np.array([1,1,1],dtype=np.float64),0, '', [''] , ['']) 
+            Body(WHITE,1,np.array([scaled_vec[0],scaled_vec[1],0],dtype=np.float64)*AU + sun.position,np.array([-normalized_vec[1],normalized_vec[0],0],dtype=np.float64)*speed + sun.velocity,0, '', [''] , ['']) 
         )
 
 
-    #return [b1,b2] 
-    #return [b4,b3,b2,b1] 
-    #return [sun,venus]
-
     return bodies , asteroids
 
-    # TODO : Read these values from a combined csv. 
-
 # Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
-class Body (py.sprite.Group): 
+def _work(system, name) : # Shared (N,3) scratch array for the per-Body integrators, one per System rather than one per body.
+
+    if name not in system.work :
+        system.work[name] = np.zeros((len(system),3), dtype=np.float64)
+
+    return system.work[name]
+
+class Body : # * Handle on one row of a System, position / velocity / mass and the integrator scratch are views into the shared arrays. A body outside any System gets a one-row System of its own.
+
+    __slots__ = ('system', 'index', 'name', 'parents', 'sons', 'radius', 'color', 'center', 'center_offset', '_orbit_points')
 
     def __init__(self,color,radius,position,velocity, mass, name, parents, sons) :
-        super().__init__()
 
         # family
         self.name = name
@@ -327,92 +453,109 @@ class Body (py.sprite.Group):
         # colors and shape
         self.radius = radius
         self.color = color
-        self.orbit_color = np.array([
-            self.color[0]-75,
-            self.color[1]-75, 
-            self.color[2]-75
-        ])
-        updateColor(self.orbit_color)
         self.center = False
         self.center_offset = None
         if self.name == 'sun' :
             self.center = True
 
-        # physical properties
-        self.position = position
-        self.nextposition = np.array([0,0,0])
-        self.velocity = velocity
-        self.halfvelocity = np.array([0,0,0])
-        self.force = np.array([0, 0, 0])
-        self.mass = mass
-        self.acceleration = np.array([0,0,0])
+        # physical properties, System.bind() moves them into a shared System
+        self.system = System.from_arrays(position, velocity, [mass])
+        self.index = 0
 
         # orbits
-        self.orbit_points = []
+        self._orbit_points = None
 
-    def draw(self, surface, offset, center_offset) :
+    @property
+    def position(self) :
+        return self.system.positions[self.index]
 
-        if self.velocity[0] < 0 :
-            angle = (np.arctan(self.velocity[1]/self.velocity[0])+np.pi)
-        else :
-            angle = np.arctan(self.velocity[1]/self.velocity[0])
+    @position.setter
+    def position(self, value) :
+        self.system.positions[self.index] = value
 
-        L=30
+    @property
+    def velocity(self) :
+        return self.system.velocities[self.index]
 
-        # draw_arrow(WINDOW, WHITE, (self.position[0]*SCALE+WIDTH/2+offset[0],self.position[1]*SCALE+HEIGHT/2+offset[1]), (L*np.cos(angle)+self.position[0]*SCALE+WIDTH/2+offset[0],
-        #           L*np.sin(angle)+self.position[1]*SCALE+HEIGHT/2+offset[1]),5,140)
+    @velocity.setter
+    def velocity(self, value) :
+        self.system.velocities[self.index] = value
 
-        # TODO : Figure out this scaling shit.           
+    @property
+    def mass(self) :
+        return self.system.masses[self.index]
 
-        if len(self.orbit_points) > 2 :
-            updated_points = []
-            for point in self.orbit_points :
-                if (len(updated_points)) > 500 :
-                    updated_points.pop(0)
+    @mass.setter
+    def mass(self, value) :
+        self.system.masses[self.index] = value
 
-                x,y = point
-                x = x * SCALE + WIDTH/2 + offset[0] + center_offset[0]
-                y = y * SCALE + HEIGHT/2 + offset[1] + center_offset[1]
+    @property
+    def force(self) :
+        return _work(self.system, 'force')[self.index]
 
-                updated_points.append((x,y))
+    @property
+    def acceleration(self) :
+        return _work(self.system, 'acceleration')[self.index]
 
-            if updated_points[0][0] > -15000 and updated_points[0][0] < (WIDTH+15000) and updated_points[0][1] > -15000 and updated_points[0][1] < (HEIGHT+15000) : 
-                py.draw.aalines(WINDOW,self.orbit_color,False,updated_points,2)
+    @property
+    def halfvelocity(self) :
+        return _work(self.system, 'halfvelocity')[self.index]
 
-        if (self.position[0]*SCALE+WIDTH/2+offset[0] + center_offset[0]) > -1 and self.position[0]*SCALE+WIDTH/2+offset[0] + center_offset[0] < (WIDTH + 1) and self.position[1]*SCALE+HEIGHT/2+offset[1] + center_offset[1] > -1 and self.position[1]*SCALE+HEIGHT/2+offset[1] + center_offset[1] < (HEIGHT + 1) : 
+    @halfvelocity.setter
+    def halfvelocity(self, value) :
+        _work(self.system, 'halfvelocity')[self.index] = value
 
-            gfx.aacircle(surface, int(self.position[0]*SCALE+WIDTH/2+offset[0] + center_offset[0]), int(self.position[1]*SCALE+HEIGHT/2+offset[1] + center_offset[1]), int(self.radius), self.color)
-            gfx.filled_circle(surface, int(self.position[0]*SCALE+WIDTH/2+offset[0] + center_offset[0] ), int(self.position[1]*SCALE+HEIGHT/2+offset[1] + center_offset[1]), int(self.radius), self.color)
+    @property
+    def orbit_color(self) :
+        return np.clip(np.asarray(self.color) - 75, 0, None)
 
-    def draw_particles(self, surface, offset) :
+    @property
+    def orbit_points(self) : # Made on first use, particles never draw a trail so they never pay for one.
 
-        if _magnitude(self.velocity) > 1000 :
+        if self._orbit_points is None :
+            self._orbit_points = Trail()
 
-            particle = Particle(np.array([self.position[0]*SCALE+WIDTH/2,self.position[1]*SCALE+HEIGHT/2]),-self.velocity,0.02,random.randint(int(self.radius*2/6),int(self.radius*2/3)),self.color)
-            
-            particles.append(particle)
-            
-            for particle in particles :
-            
-                particle.draw(surface,offset)
-                particle.move()
-                particle.update(particles)
+        return self._orbit_points
+
+    def draw(self, surface, point) : # Disc at a point draw_bodies() has already projected and culled.
+
+        gfx.aacircle(surface, point[0], point[1], int(self.radius), self.color)
+        gfx.filled_circle(surface, point[0], point[1], int(self.radius), self.color)
+
+        # L=30
+        # angle = np.arctan2(self.velocity[1], self.velocity[0])
+        # draw_arrow(surface, WHITE, point, (L*np.cos(angle)+point[0], L*np.sin(angle)+point[1]), 5, 140)
+
+    def draw_trail(self, surface, origin) : # Cached simplified trail, skipped when its bounds miss the window.
+
+        if len(self.orbit_points) <= 2 :
+            return
+
+        points = self.orbit_points.simplified(SCALE) + origin # the cache is kept without the origin, so panning and following never invalidate it
+
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        if high[0] < 0 or high[1] < 0 or low[0] > WIDTH or low[1] > HEIGHT :
+            return
+
+        if len(points) > 1 :
+            py.draw.aalines(surface, self.orbit_color, False, points, 2)
 
     def add_force(self, force_array) :
 
-        self.force = self.force + force_array
+        self.force[:] += force_array
 
     def reset_force(self) :
 
-        self.force = np.array([0,0,0])
+        self.force[:] = 0
 
     def add_acceleration(self, acceleration_array) :
 
-        self.acceleration = self.acceleration + acceleration_array
+        self.acceleration[:] += acceleration_array
 
     def reset_acceleration(self) :
 
-        self.acceleration = np.array([0,0,0]) 
+        self.acceleration[:] = 0
 
     def move(self) :
 
@@ -435,40 +578,160 @@ class Body (py.sprite.Group):
 
         angle += 1
 
-class Particle() :
-    def __init__(self,position,velocity,shrinkrate,size,color) :
-        
-        # colors and shape
-        self.shrinkrate = shrinkrate
-        self.size = size
-        self.color = color     
+class Trail : # * Preallocated ring buffer of (x,y) orbit points, the oldest point is overwritten once full.
 
-        # physical properties
-        self.position = position
-        self.velocity = velocity
+    def __init__(self, capacity=TRAIL_LENGTH) :
 
-    def update(self,particles) :
+        self.points = np.zeros((capacity,2), dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.total = 0 # points ever appended, so a point keeps its number as the ring turns over
 
-        self.size = self.size - self.shrinkrate
+        self.scale = None # decimation cache, numbers of the kept points at this scale
+        self.kept = collections.deque()
+        self.done = 0
+        self.length = 0 # metres of trail up to point done - 1
+        self.next = 0 # length at which the next point is kept
+        self.last = None
+        self.drawn = None # what the last call returned, reused until a point arrives or the scale changes
 
-        self.color = [self.color[0]-1.5,self.color[1]-1.5,self.color[2]-1.5]
+    def __len__(self) :
+        return self.count
 
-        updateColor(self.color)
+    def append(self, point) :
 
-        if self.size <= 0 or _magnitude(self.color) == 0:
-            particles.remove(self)   
-        
-    def draw(self,surface,offset,center_offset) :
+        self.points[self.head] = point
+        self.head = (self.head + 1) % len(self.points)
+        self.count = min(self.count + 1, len(self.points))
+        self.total += 1
 
-        py.draw.circle(surface,self.color,(self.position[0]+offset[0] + center_offset[0],self.position[1]+offset[1] + + center_offset[1]),self.size)
+    def clear(self) : # Numbering starts over with the ring, simplified() finds slots as number % capacity.
 
-    def move(self) :
+        self.head = 0
+        self.count = 0
+        self.total = 0
+
+        self.scale = None
+        self.kept.clear()
+        self.done = 0
+        self.length = 0
+        self.next = 0
+        self.last = None
+        self.drawn = None
+
+    def ordered(self) : # Oldest to newest.
+
+        if self.count < len(self.points) :
+            return self.points[:self.count]
+
+        return np.concatenate((self.points[self.head:], self.points[:self.head]))
 
-        self.position[0] += random.randint(-10,10)/25
-        self.position[1] += random.randint(-10,10)/25 
+    def simplified(self, scale, spacing=TRAIL_STEP) : # * Oldest to newest in pixels from the origin, one point per spacing pixels of trail. Only points appended since the last call are decimated, a new scale starts over.
+
+        oldest = self.total - self.count
+
+        if scale != self.scale or self.done < oldest : # zoomed, cleared, or so far behind that the ring has lapped the cache
+            self.scale = scale
+            self.kept.clear()
+            self.done = oldest
+            self.length = 0
+            self.next = 0
+            self.last = None
+            self.drawn = None
+
+        if self.drawn is not None and self.done == self.total :
+            return self.drawn
+
+        step = spacing / scale # metres of trail per kept point
+
+        for number in range(self.done, self.total) : # usually one or two points a frame, too few for NumPy to pay off
+
+            x, y = self.points[number % len(self.points)]
+            if self.last is not None :
+                self.length += math.hypot(x - self.last[0], y - self.last[1])
+
+            if self.length >= self.next :
+                self.kept.append(number)
+                self.next = (math.floor(self.length / step) + 1) * step
+
+            self.last = (x, y)
+
+        self.done = self.total
+
+        while self.kept and self.kept[0] < oldest :
+            self.kept.popleft()
+
+        kept = np.fromiter(self.kept, dtype=np.int64, count=len(self.kept))
+        if len(kept) == 0 or kept[-1] != self.total - 1 :
+            kept = np.append(kept, self.total - 1) # the newest point always, so the trail still meets the body
+
+        self.drawn = self.points[kept % len(self.points)] * scale
+
+        return self.drawn
+
+class Emitter : # * Fixed pool of exhaust particles held as arrays, spawned, aged, culled and drawn in bulk every frame.
+
+    def __init__(self, capacity=PARTICLES) :
+
+        self.positions = np.zeros((capacity,2), dtype=np.float64) # metres, so zooming and panning move them with the bodies
+        self.sizes = np.zeros(capacity, dtype=np.float64)
+        self.colors = np.zeros((capacity,3), dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.head = 0
+
+    def __len__(self) :
+        return int(np.count_nonzero(self.alive))
+
+    def emit(self, positions, sizes, colors) : # New particles overwrite the slots after head, which always hold the oldest ones.
+
+        count = min(len(positions), len(self.alive))
+        slots = (self.head + np.arange(count)) % len(self.alive)
+
+        self.positions[slots] = positions[:count]
+        self.sizes[slots] = sizes[:count]
+        self.colors[slots] = colors[:count]
+        self.alive[slots] = True
+
+        self.head = (self.head + count) % len(self.alive)
+
+    def update(self) :
+
+        alive = self.alive
+
+        self.sizes[alive] -= SHRINK
+        self.colors[alive] = np.maximum(self.colors[alive] - FADE, 0)
+        self.positions[alive] += np.random.uniform(-JITTER, JITTER, (np.count_nonzero(alive),2)) / SCALE
+
+        alive &= (self.sizes > 0) & self.colors.any(axis=1)
+
+    def draw(self, surface, offset, center_offset) : # * Every particle is stamped as a filled disc, one array write per disc radius.
+
+        alive = np.flatnonzero(self.alive)
+        if len(alive) == 0 :
+            return
+
+        screen = np.floor(self.positions[alive] * SCALE + (WIDTH/2 + offset[0] + center_offset[0], HEIGHT/2 + offset[1] + center_offset[1])).astype(int)
+        radii = np.floor(self.sizes[alive]).astype(int)
+        colors = self.colors[alive].astype(np.uint8)
+
+        pixels = py.surfarray.pixels3d(surface)
+
+        for radius in np.unique(radii) :
+
+            picked = radii == radius
+            dx, dy = np.nonzero(np.add.outer(np.arange(-radius, radius+1)**2, np.arange(-radius, radius+1)**2) <= radius**2)
+
+            x = (screen[picked,0,np.newaxis] + dx - radius).ravel()
+            y = (screen[picked,1,np.newaxis] + dy - radius).ravel()
+            color = np.repeat(colors[picked], len(dx), axis=0)
+
+            visible = (x >= 0) & (x < WIDTH) & (y >= 0) & (y < HEIGHT)
+            pixels[x[visible],y[visible]] = color[visible]
+
+        del pixels # unlocks the surface
 
 # Main --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
-def main() :
+def main(replay=None) : # replay is a trajectory file to play back instead of integrating
 
     global SCALE
     global SCALER
@@ -476,7 +739,30 @@ def main() :
     SCALER = 200
     SCALE = SCALER/AU
 
-    bodies , asteroids  = init()
+    setup()
+
+    if replay is None :
+        trajectory = None
+        bodies , asteroids  = init()
+        system = System(bodies, asteroids) # asteroids are massless, they only feel the bodies
+        system.particles.linked = False # drawn straight from the arrays
+        _precision(system, SINGLE, COMPENSATED)
+        system.monitor = Monitor(EVERY)
+    else :
+        trajectory = Trajectory(replay)
+        bodies , system = _replaySystem(trajectory)
+        cursor = 0 # fractional frame being shown
+        shown = 0 # last whole frame pushed onto the trails
+        frame_time = (trajectory.time(len(trajectory)-1) - trajectory.time(0)) / max(len(trajectory)-1, 1) or TIMESKIP
+
+    overlay = True
+
+    exhaust = False # E sheds particles behind the fast bodies
+    emitter = Emitter()
+    radii = np.array([body.radius for body in bodies], dtype=np.float64)
+    colors = np.array([body.color for body in bodies], dtype=np.float64)
+
+    acceleration = _gravity(GRAVITY, THETA, SOFTENING, single=SINGLE)
 
     oldmousex = 0
     oldmousey = 0
@@ -485,6 +771,12 @@ def main() :
     center_offset = (0,0)
     offsetting = False
 
+    speed = SPEED
+    accumulator = 0
+    prev_time = time.time()
+    previous = system.positions.copy()
+    previous_asteroids = system.particles.positions.copy()
+
     sim = True
     running = True
     while running :
@@ -515,7 +807,7 @@ def main() :
 
                 if event.key == py.K_r:
                     running = False
-                    main()
+                    main(replay)
 
                 if event.key == py.K_t:
                     offset = np.array([0,0])
@@ -543,6 +835,41 @@ def main() :
                     else :
                         sim = True
 
+                if event.key == py.K_m:
+                    overlay = not overlay
+
+                if event.key == py.K_e:
+                    exhaust = not exhaust
+
+                if event.key == py.K_F5 and trajectory is None:
+                    save_checkpoint(CHECKPOINT, system)
+
+                if event.key == py.K_F9 and trajectory is None and os.path.exists(CHECKPOINT):
+                    load_checkpoint(CHECKPOINT, system)
+                    for body in bodies :
+                        body.orbit_points.clear()
+                    previous = system.positions.copy()
+                    previous_asteroids = system.particles.positions.copy()
+                    accumulator = 0
+
+                if event.key in (py.K_LEFT, py.K_RIGHT, py.K_HOME) and trajectory is not None: # scrub a hundredth of the recording
+                    jump = max(1, len(trajectory) // 100)
+                    if event.key == py.K_LEFT :
+                        cursor = max(0, cursor - jump)
+                    elif event.key == py.K_RIGHT :
+                        cursor = min(len(trajectory) - 1, cursor + jump)
+                    else :
+                        cursor = 0
+                    shown = int(cursor)
+                    for body in bodies :
+                        body.orbit_points.clear()
+
+                if event.key == py.K_RIGHTBRACKET:
+                    speed = speed * 2
+
+                if event.key == py.K_LEFTBRACKET:
+                    speed = speed / 2
+
             if event.type == py.MOUSEWHEEL :
                 if event.y < 0 :
                     SCALER -= 1
@@ -573,37 +900,204 @@ def main() :
         oldmousey = mousey
 
         # Update    
-        if sim :
-            pass
-            #updateBodies(bodies)
-            
-            #updateBodiesLeapfrog(bodies) 
+        prev_time,dt = _deltatime(prev_time)
+
+        if trajectory is not None :
+            if sim :
+                cursor = min(cursor + dt * speed / frame_time, len(trajectory) - 1)
+
+            frame = int(cursor)
+            after = min(frame + 1, len(trajectory) - 1)
+
+            for i in range(max(shown + 1, frame - TRAIL_LENGTH + 1), frame + 1) :
+                for body, position in zip(bodies, trajectory.positions(i)) :
+                    body.orbit_points.append(position[:2])
+            shown = max(shown, frame)
+
+            previous = np.array(trajectory.positions(frame))
+            previous_asteroids = np.array(trajectory.particle_positions(frame))
+            system.positions[:] = trajectory.positions(after)
+            system.velocities[:] = (system.positions - previous) / frame_time
+            system.particles.positions[:] = trajectory.particle_positions(after)
+            system.time = trajectory.time(frame)
+            accumulator = (cursor - frame) * TIMESKIP # blend fraction for _interpolate below
+
+        elif sim :
+            accumulator = accumulator + dt * speed
+            substeps = 0
+
+            while accumulator >= TIMESKIP and substeps < MAX_SUBSTEPS :
+
+                previous = system.positions.copy()
+                previous_asteroids = system.particles.positions.copy()
+
+                #updateBodies(bodies)
+                
+                #updateBodiesLeapfrog(bodies) 
+
+                #updateBodiesRungeKutta(bodies)
+
+                updateSystemRungeKutta(system, TIMESKIP, acceleration)
+
+                #updateSystemLeapfrog(system, TIMESKIP, acceleration) # one force pass per step, best energy stability per unit of CPU
+
+                #updateSystemBlockTimestep(system, TIMESKIP, acceleration) # moons subcycle, planets take the whole step
+
+                #updateSystemKepler(system, TIMESKIP, acceleration) # moons ride exact orbits about their planet, survives much longer steps
+
+                #updateSystemWisdomHolman(system, TIMESKIP, acceleration) # planets on Kepler orbits about the sun too, steps of days for the whole solar system
+
+                accumulator = accumulator - TIMESKIP
+                substeps += 1
 
-            updateBodiesRungeKutta(bodies)
+            if substeps == MAX_SUBSTEPS : # can't keep up, drop the backlog instead of spiralling
+                accumulator = min(accumulator, TIMESKIP)
+
+        drawn = _interpolate(system, previous, accumulator / TIMESKIP)
+        asteroid_positions = previous_asteroids + accumulator / TIMESKIP * (system.particles.positions - previous_asteroids)
 
         py.display.update()
 
         # Render
         WINDOW.fill(DIM_GRAY)
         
-        for body in bodies :
+        for body, position in zip(bodies, drawn) :
 
             if body.center == True : 
 
-                center_offset = ((WIDTH / 2) - (body.position[0]*SCALE+WIDTH/2+offset[0]) , (HEIGHT / 2)  - (body.position[1]*SCALE+HEIGHT/2+offset[1]))
+                center_offset = ((WIDTH / 2) - (position[0]*SCALE+WIDTH/2+offset[0]) , (HEIGHT / 2)  - (position[1]*SCALE+HEIGHT/2+offset[1]))
 
-            #body.draw_particles(WINDOW,offset,center_offset)
+        if exhaust :
+            moving = np.linalg.norm(system.velocities, axis=1) > EXHAUST_SPEED
+            emitter.emit(drawn[moving,:2], np.random.uniform(radii[moving]/3, radii[moving]*2/3), colors[moving])
 
-            body.draw(WINDOW,offset,center_offset)  
-            
-        for asteroid in asteroids :
-            
-            asteroid.move_asteroid()
-            
-            asteroid.draw(WINDOW,offset,center_offset)
+        emitter.update()
+        emitter.draw(WINDOW, offset, center_offset)
+
+        draw_bodies(WINDOW, bodies, drawn, radii, offset, center_offset)
             
+        draw_points(WINDOW, asteroid_positions, WHITE, offset, center_offset)
+
+        if overlay and trajectory is None :
+            draw_overlay(WINDOW, system.monitor.lines())
+
+        if overlay and trajectory is not None :
+            draw_overlay(WINDOW, [f't = {system.time / YEAR:.3f} yr', f'frame {int(cursor)} / {len(trajectory) - 1}', f'x{speed / SPEED:g}' if sim else 'paused'])
 
     return 0
 
+def simulate(years, dt=TIMESKIP, integrator='leapfrog', gravity=GRAVITY, theta=THETA, log=None, every=EVERY, resume=None, checkpoint=None, checkpoint_every=CHECKPOINT_EVERY, trajectory=None, record_every=1, catalog=None, collisions=None, encounter=ENCOUNTER, events=None, softening=SOFTENING, order=ORDER, validate=0, single=SINGLE, compensated=COMPENSATED) : # * Headless run, no window, no audio and no frame clock, steps as fast as the CPU allows.
+
+    if catalog is None :
+        bodies , asteroids = init()
+        system = System(bodies, asteroids)
+        colors = [body.color.tolist() for body in bodies]
+        radii = [float(body.radius) for body in bodies]
+    else :
+        table = load_catalog(catalog) # straight into arrays, no Body objects
+        system = table.system()
+        colors = table.colors[table.masses > 0].tolist()
+        radii = table.radii[table.masses > 0].tolist()
+
+    if collisions == 'merge' and trajectory is not None :
+        raise ValueError('merging changes the number of bodies, a trajectory file has a fixed frame size')
+
+    update = INTEGRATORS[integrator]
+    acceleration = _gravity(gravity, theta, softening, order, validate, single) # bad backend options raise before any file is touched
+
+    if resume is not None :
+        load_checkpoint(resume, system)
+
+    system.linked = False
+    if system.particles is not None :
+        system.particles.linked = False
+    system.monitor = Monitor(every, log)
+
+    writer = None
+    if trajectory is not None :
+        writer = TrajectoryWriter(trajectory, system, record_every, {'dt' : dt, 'colors' : colors, 'radii' : radii}, append=resume is not None)
+        if writer.last() is None or writer.last() < system.time :
+            writer.append(system)
+
+    _precision(system, single, compensated)
+
+    detector = None
+    if collisions is not None :
+        detector = Collisions(collisions, encounter, path=events)
+
+    steps = int(round(years * YEAR / dt))
+    begin = system.time
+
+    start = time.time()
+    for i in range(steps) :
+        if detector is None :
+            update(system, dt, acceleration)
+        else :
+            detector.step(system, dt, update, acceleration)
+
+        if writer is not None :
+            writer.record(system)
+
+        if checkpoint is not None and system.steps % checkpoint_every == 0 :
+            save_checkpoint(checkpoint, system)
+            if writer is not None :
+                writer.flush()
+    elapsed = time.time() - start
+
+    system.monitor.close()
+    if detector is not None :
+        detector.close()
+        print(f"{sum(event['kind'] == 'encounter' for event in detector.events)} close encounters , {sum(event['kind'] == 'merge' for event in detector.events)} mergers")
+    if writer is not None :
+        writer.close()
+    if checkpoint is not None :
+        save_checkpoint(checkpoint, system)
+
+    simulated = (system.time - begin) / YEAR
+    print(f'{steps} {integrator} steps , {simulated:.3f} years in {elapsed:.2f} s ({simulated/max(elapsed,1e-9):.3f} years/s , {system.evaluations} force evaluations)')
+    print(' , '.join(system.monitor.lines()))
+    if gravity == 'fmm' and acceleration.errors :
+        print(f"fmm against direct summation , worst {max(error[1] for error in acceleration.errors):.3e} , rms {np.sqrt(np.mean([error[2]**2 for error in acceleration.errors])):.3e} over {len(acceleration.errors)} checks")
+
+    return system
+
 if __name__ == '__main__' :
-    main()
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description='Newtonian Simulator')
+    parser.add_argument('--headless', action='store_true', help='integrate without opening a window or starting audio')
+    parser.add_argument('--catalog', help='headless runs integrate this .csv/.json catalog instead of init()')
+    parser.add_argument('--replay', help='play back a recorded trajectory instead of integrating')
+    parser.add_argument('--years', type=float, default=1, help='simulated years for a headless run')
+    parser.add_argument('--dt', type=float, default=TIMESKIP, help='step size in seconds')
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='leapfrog')
+    parser.add_argument('--gravity', choices=['direct','jit','barneshut','fmm'], default=GRAVITY)
+    parser.add_argument('--theta', type=float, default=THETA, help='Barnes-Hut opening angle')
+    parser.add_argument('--order', type=int, default=ORDER, help='fast multipole expansion order')
+    parser.add_argument('--validate', type=int, default=0, help='force evaluations between fast multipole checks against direct summation, 0 never checks')
+    parser.add_argument('--softening', type=float, default=SOFTENING, help='Plummer softening length in metres')
+    parser.add_argument('--single', action='store_true', default=SINGLE, help='float32 forces in AU / day / solar-mass units, direct gravity only')
+    parser.add_argument('--compensated', action='store_true', default=COMPENSATED, help='Kahan-summed position updates')
+    parser.add_argument('--log', help='CSV file for the energy / momentum / angular momentum samples')
+    parser.add_argument('--every', type=int, default=EVERY, help='steps between conserved-quantity samples')
+    parser.add_argument('--resume', help='checkpoint to continue from')
+    parser.add_argument('--checkpoint', help='checkpoint written every --checkpoint-every steps and at the end')
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument('--trajectory', help='memory-mapped trajectory file to record frames into, with --resume the existing frames are kept and appended to')
+    parser.add_argument('--record-every', type=int, default=1, help='steps between recorded frames')
+    parser.add_argument('--collisions', choices=RESPONSES, help='watch for close encounters and contacts and log, merge or subcycle through them')
+    parser.add_argument('--encounter', type=float, default=ENCOUNTER / AU, help='close-encounter distance in AU')
+    parser.add_argument('--events', help='CSV file for the encounter and collision events')
+    args = parser.parse_args()
+
+    if args.single and args.gravity != 'direct' : # caught before simulate opens any file
+        parser.error('--single needs --gravity direct')
+
+    if args.headless :
+        simulate(
+            args.years, dt=args.dt, integrator=args.integrator, gravity=args.gravity, theta=args.theta, log=args.log, every=args.every,
+            resume=args.resume, checkpoint=args.checkpoint, checkpoint_every=args.checkpoint_every, trajectory=args.trajectory, record_every=args.record_every,
+            catalog=args.catalog, collisions=args.collisions, encounter=args.encounter * AU, events=args.events, softening=args.softening,
+            order=args.order, validate=args.validate, single=args.single, compensated=args.compensated,
+        )
+    else :
+        main(args.replay)
\ No newline at end of file
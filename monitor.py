@@ -0,0 +1,82 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import numpy as np
+
+from physics import YEAR
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+EVERY = 10 # steps between samples
+
+COLUMNS = ['step', 'time', 'energy', 'energy_drift', 'momentum', 'momentum_drift', 'angular_momentum', 'angular_momentum_drift']
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _relative(change, scale) : # A lone body at rest has nothing to compare against.
+    return change / scale if scale != 0 else 0.0
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class Monitor : # * Energy, momentum and angular momentum of the massive bodies, the potential is handed over by the integrator's own force pass.
+
+    def __init__(self, every=EVERY, path=None) :
+
+        self.every = every
+        self.initial = None
+        self.latest = None
+
+        self.file = None
+        if path is not None :
+            self.file = open(path, 'w')
+            self.file.write(','.join(COLUMNS) + '\n')
+
+    def due(self, step) :
+        return step % self.every == 0
+
+    def record(self, system, potentials, step) :
+
+        x = system.positions
+        v = system.velocities
+        m = system.masses
+
+        kinetic = 0.5 * np.sum(m * np.einsum('ij,ij->i', v, v))
+        energy = kinetic + 0.5 * np.sum(m * potentials)
+        momentum = np.sum(m[:,np.newaxis] * v, axis=0)
+        angular_momentum = np.sum(m[:,np.newaxis] * np.cross(x, v), axis=0)
+
+        if self.initial is None :
+            self.initial = {
+                'energy' : energy,
+                'momentum' : momentum,
+                'momentum_scale' : np.sum(m * np.linalg.norm(v, axis=1)), # |p| can start near zero, compare against the total instead
+                'angular_momentum' : angular_momentum,
+            }
+
+        self.latest = {
+            'step' : step,
+            'time' : system.time,
+            'energy' : energy,
+            'energy_drift' : _relative(abs(energy - self.initial['energy']), abs(self.initial['energy'])),
+            'momentum' : np.linalg.norm(momentum),
+            'momentum_drift' : _relative(np.linalg.norm(momentum - self.initial['momentum']), self.initial['momentum_scale']),
+            'angular_momentum' : np.linalg.norm(angular_momentum),
+            'angular_momentum_drift' : _relative(np.linalg.norm(angular_momentum - self.initial['angular_momentum']), np.linalg.norm(self.initial['angular_momentum'])),
+        }
+
+        if self.file is not None :
+            self.file.write(','.join(repr(float(self.latest[column])) for column in COLUMNS) + '\n')
+            self.file.flush()
+
+    def lines(self) : # Text for the in-window overlay.
+
+        if self.latest is None :
+            return []
+
+        return [
+            f"t = {self.latest['time'] / YEAR:.3f} yr",
+            f"dE/E = {self.latest['energy_drift']:.2e}",
+            f"dP/P = {self.latest['momentum_drift']:.2e}",
+            f"dL/L = {self.latest['angular_momentum_drift']:.2e}",
+        ]
+
+    def close(self) :
+
+        if self.file is not None :
+            self.file.close()
+            self.file = None
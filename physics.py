@@ -0,0 +1,768 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import itertools
+
+import numpy as np
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+G = 6.67430e-11
+AU = 1.496e11
+YEAR = 3.154e+7
+DAY = 86400
+MSUN = 1.98892e30
+G_SCALED = G * MSUN * DAY**2 / AU**3 # about 2.959e-4 AU^3 Msun^-1 day^-2, keeps the float32 pass well inside its range
+
+PAIR_CHUNK = 1 << 21 # Max target-source pairs held in memory at once by _field.
+
+ETA = 0.02      # Fraction of the shortest two-body orbital timescale a body may step over.
+MAX_LEVEL = 12  # Deepest block level, the smallest step is dt / 2**MAX_LEVEL.
+HEAVY = 16      # Heaviest bodies every block timescale is measured against, the rest only count from the neighbouring grid cells.
+NEIGHBOURS = 8  # Bodies the average body shares its timescale grid cell with, picks the cell size.
+
+HALF_SHELL = [offset for offset in itertools.product((-1,0,1), repeat=3) if offset >= (0,0,0)] # own cell plus 13 neighbours, each neighbouring pair of cells searched once
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _field(targets, sources, masses, potential=False, softening=0, g=G) : # * Acceleration felt at every target from every source, pairs at zero separation are skipped. potential=True also returns -G sum(m/r) per target from the same distances, softening is the Plummer length. Works in the dtype of targets.
+
+    accelerations = np.zeros((len(targets),3), dtype=targets.dtype)
+    potentials = np.zeros(len(targets), dtype=targets.dtype)
+
+    if len(sources) == 0 :
+        return (accelerations, potentials) if potential else accelerations
+
+    step = max(1, PAIR_CHUNK * 8 // targets.itemsize // len(sources)) # same bytes per chunk, so twice the pairs in float32
+
+    for start in range(0, len(targets), step) :
+
+        separation = sources[np.newaxis,:,:] - targets[start:start+step,np.newaxis,:]
+        square = np.einsum('ijk,ijk->ij', separation, separation)
+        distance = np.sqrt(square + softening**2)
+        distance[square == 0] = np.inf
+
+        accelerations[start:start+step] = g * np.einsum('ij,ijk->ik', masses / distance**3, separation)
+
+        if potential :
+            potentials[start:start+step] = -g * (masses / distance).sum(axis=1)
+
+    return (accelerations, potentials) if potential else accelerations
+
+def _accelerations(positions, masses, active=None, potential=False, softening=0) : # Only the rows picked by active are evaluated, every body still acts as a source.
+
+    if active is None :
+        return _field(positions, positions, masses, potential, softening)
+
+    return _field(positions[active], positions, masses, potential, softening)
+
+def _fieldSingle(targets, sources, masses, potential=False, softening=0) : # * _field in float32 on AU, days and solar masses about the centre of the sources, half the memory traffic for runs that are only watched. Comes back in SI float64.
+
+    centre = sources.mean(axis=0) if len(sources) else np.zeros(3)
+
+    result = _field(((targets - centre) / AU).astype(np.float32), ((sources - centre) / AU).astype(np.float32), (masses / MSUN).astype(np.float32), potential, np.float32(softening / AU), G_SCALED)
+
+    if potential :
+        return result[0].astype(np.float64) * (AU / DAY**2), result[1].astype(np.float64) * (AU / DAY)**2
+
+    return result.astype(np.float64) * (AU / DAY**2)
+
+def _accelerationsSingle(positions, masses, active=None, potential=False, softening=0) : # Same contract as _accelerations through _fieldSingle.
+
+    if active is None :
+        return _fieldSingle(positions, positions, masses, potential, softening)
+
+    return _fieldSingle(positions[active], positions, masses, potential, softening)
+
+def _particleField(particles) : # What the particles feel the massive bodies through, float32 when the set asks for it.
+    return _fieldSingle if particles.single else _field
+
+def _advance(system, change) : # * positions += change, Kahan compensated when system.compensated so the low bits every step rounds away are carried into the next.
+
+    if not system.compensated :
+        system.positions += change
+        return
+
+    if system.carry is None or system.carry.shape != system.positions.shape : # first step, or rows were merged away
+        system.carry = np.zeros_like(system.positions)
+
+    change = change - system.carry
+    total = system.positions + change
+    system.carry = (total - system.positions) - change
+    system.positions[:] = total
+
+def _energy(positions, velocities, masses, softening=0) : # * Kinetic plus pairwise potential energy, each pair counted once.
+
+    kinetic = 0.5 * np.sum(masses * np.einsum('ij,ij->i', velocities, velocities))
+    potential = 0
+
+    if len(masses) == 0 :
+        return kinetic
+
+    step = max(1, PAIR_CHUNK // len(masses))
+
+    for start in range(0, len(masses), step) :
+
+        separation = positions[np.newaxis,:,:] - positions[start:start+step,np.newaxis,:]
+        square = np.einsum('ijk,ijk->ij', separation, separation)
+        distance = np.sqrt(square + softening**2)
+        distance[square == 0] = np.inf
+
+        potential -= G * np.sum(masses[start:start+step,np.newaxis] * masses[np.newaxis,:] / distance)
+
+    return kinetic + potential / 2
+
+def _timescales(targets, sources, masses, target_masses) : # * Shortest sqrt(r^3 / G(m_i + m_j)) over all sources for each target.
+
+    timescales = np.full(len(targets), np.inf)
+
+    if len(sources) == 0 :
+        return timescales
+
+    step = max(1, PAIR_CHUNK // len(sources))
+
+    for start in range(0, len(targets), step) :
+
+        separation = sources[np.newaxis,:,:] - targets[start:start+step,np.newaxis,:]
+        cube = np.einsum('ijk,ijk->ij', separation, separation) ** 1.5
+        mu = G * (target_masses[start:start+step,np.newaxis] + masses[np.newaxis,:])
+
+        with np.errstate(divide='ignore', invalid='ignore') :
+            tau = np.sqrt(cube / mu)
+        tau[(cube == 0) | (mu == 0)] = np.inf
+
+        timescales[start:start+step] = tau.min(axis=1)
+
+    return timescales
+
+def _touching(cells, reach=1) : # Every pair of rows whose integer cells are the same or at most reach apart on each axis, once as i < j.
+
+    if len(cells) < 2 :
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    shell = HALF_SHELL if reach == 1 else [offset for offset in itertools.product(range(-reach,reach+1), repeat=3) if offset >= (0,0,0)]
+
+    cells = cells - (cells.min(axis=0) - reach) # room for the -reach neighbour
+    extent = cells.max(axis=0) + reach + 1
+
+    def pack(cells) :
+        return (cells[:,0] * extent[1] + cells[:,1]) * extent[2] + cells[:,2]
+
+    keys = pack(cells)
+    order = np.argsort(keys, kind='stable')
+    unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    occupied = cells[order[starts]]
+
+    first = []
+    second = []
+
+    for offset in shell :
+
+        neighbours = pack(occupied + offset)
+        found = np.minimum(np.searchsorted(unique, neighbours), len(unique) - 1)
+        hit = unique[found] == neighbours
+
+        a = np.flatnonzero(hit)
+        b = found[hit]
+        total = counts[a] * counts[b]
+
+        pair = np.repeat(np.arange(len(a)), total)
+        k = np.arange(total.sum()) - np.repeat(np.cumsum(total) - total, total) # position inside each cell pair's block
+        i = order[starts[a][pair] + k // counts[b][pair]]
+        j = order[starts[b][pair] + k % counts[b][pair]]
+
+        if offset == (0,0,0) :
+            keep = i < j
+            i , j = i[keep], j[keep]
+
+        first.append(i)
+        second.append(j)
+
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+
+    return np.minimum(first, second), np.maximum(first, second)
+
+def _nearTimescales(positions, masses, heavy=HEAVY, neighbours=NEIGHBOURS) : # * _timescales(x, x, m, m) in O(N): every body against the heaviest few exactly, against the rest only inside the neighbouring grid cells. Never longer than the all-pairs value, a light body further out is covered by the bound one cell width gives.
+
+    n = len(masses)
+    if n <= heavy :
+        return _timescales(positions, positions, masses, masses)
+
+    rows = np.argpartition(masses, n - heavy)[n - heavy:]
+    timescales = _timescales(positions, positions[rows], masses[rows], masses)
+
+    low = positions.min(axis=0)
+    size = np.ptp(positions, axis=0).max() * 1.0001
+    if size == 0 :
+        size = 1.0
+
+    for depth in range(1, 21) : # finest grid whose cells still hold about neighbours bodies per body, discs and clusters fill far fewer than 8^depth cells
+        cells = np.minimum(((positions - low) / size * 2**depth).astype(np.int64), 2**depth - 1)
+        counts = np.unique((cells[:,0] << 2*depth) | (cells[:,1] << depth) | cells[:,2], return_counts=True)[1]
+        if (counts**2).sum() <= neighbours * n :
+            break
+
+    i, j = _touching(cells)
+    separation = positions[j] - positions[i]
+    cube = np.einsum('ij,ij->i', separation, separation) ** 1.5
+    mu = G * (masses[i] + masses[j])
+
+    with np.errstate(divide='ignore', invalid='ignore') :
+        tau = np.sqrt(cube / mu)
+    tau[(cube == 0) | (mu == 0)] = np.inf
+
+    np.minimum.at(timescales, i, tau)
+    np.minimum.at(timescales, j, tau)
+
+    light = np.delete(masses, rows).max() # heaviest body the exact pass left out, anything it missed sits at least a cell width away
+    width = size / 2**depth
+    with np.errstate(divide='ignore') :
+        bound = np.sqrt(width**3 / (G * (masses + light)))
+
+    return np.minimum(timescales, bound)
+
+def _levels(timescales, dt, eta=ETA, max_level=MAX_LEVEL) : # Power-of-two level per body, level l steps with dt / 2**l.
+
+    with np.errstate(divide='ignore') :
+        levels = np.ceil(np.log2(dt / (eta * timescales)))
+
+    return np.clip(levels, 0, max_level).astype(int)
+
+def _stumpff(z) : # Stumpff C(z) and S(z), series near zero where the closed forms cancel.
+
+    small = np.abs(z) < 1e-4
+    root = np.sqrt(np.abs(np.where(small, 1.0, z)))
+
+    C = np.where(z > 0, (1 - np.cos(root)) / root**2, (np.cosh(root) - 1) / root**2)
+    S = np.where(z > 0, (root - np.sin(root)) / root**3, (np.sinh(root) - root) / root**3)
+
+    C = np.where(small, 1/2 - z/24 + z**2/720, C)
+    S = np.where(small, 1/6 - z/120 + z**2/5040, S)
+
+    return C, S
+
+def _universalKepler(r, v, mu, dt, tolerance=1e-13, iterations=50) : # * Exact two-body flow in universal variables, rows of relative r and v advanced by dt about mu = G(m1 + m2). Works for bound and unbound orbits alike.
+
+    r0 = np.linalg.norm(r, axis=1)
+    vr0 = np.einsum('ij,ij->i', r, v) / r0
+    alpha = 2 / r0 - np.einsum('ij,ij->i', v, v) / mu # 1/a, negative when unbound
+    root = np.sqrt(mu)
+
+    chi = root * np.abs(alpha) * dt # exact for circular orbits
+    chi = np.where(alpha > 0, chi, root * dt / r0)
+
+    for i in range(iterations) :
+
+        z = alpha * chi**2
+        C, S = _stumpff(z)
+
+        F = r0 * vr0 / root * chi**2 * C + (1 - alpha * r0) * chi**3 * S + r0 * chi - root * dt
+        dF = r0 * vr0 / root * chi * (1 - z * S) + (1 - alpha * r0) * chi**2 * C + r0
+
+        delta = F / dF
+        chi = chi - delta
+
+        if np.all(np.abs(delta) <= tolerance * np.maximum(np.abs(chi), 1)) :
+            break
+
+    z = alpha * chi**2
+    C, S = _stumpff(z)
+
+    f = 1 - chi**2 / r0 * C
+    g = dt - chi**3 / root * S
+    position = f[:,np.newaxis] * r + g[:,np.newaxis] * v
+
+    distance = np.linalg.norm(position, axis=1)
+    df = root / (distance * r0) * (z * chi * S - chi)
+    dg = 1 - chi**2 / distance * C
+    velocity = df[:,np.newaxis] * r + dg[:,np.newaxis] * v
+
+    return position, velocity
+
+def _groups(names, parents) : # * Satellite systems for the Kepler drift, (parent row, son rows) for every parent that orbits something itself, so moons group around planets and planets stay with the sun.
+
+    rows = {name : i for i,name in enumerate(names) if name}
+    groups = {}
+
+    for i,parent in enumerate(parents) :
+        if parent in rows and parents[rows[parent]] in rows :
+            groups.setdefault(rows[parent], []).append(i)
+
+    return [(parent, np.array(sons)) for parent, sons in groups.items()]
+
+def _keplerKick(positions, masses, groups) : # Adds back each satellite's pull toward its parent, that part of the force is carried by the drift instead.
+
+    correction = np.zeros_like(positions)
+
+    for parent, sons in groups :
+
+        r = positions[sons] - positions[parent]
+        k = G * (masses[parent] + masses[sons])[:,np.newaxis] * r / np.linalg.norm(r, axis=1)[:,np.newaxis]**3
+
+        total = masses[parent] + masses[sons].sum()
+        correction[parent] = -np.sum(masses[sons,np.newaxis] * k, axis=0) / total # leaves the group's centre of mass unkicked
+        correction[sons] = correction[parent] + k
+
+    return correction
+
+def _satelliteDrift(positions, velocities, masses, groups, dt) : # Satellites follow two-body orbits about their parent while the group's centre of mass coasts, everything else moves in a straight line.
+
+    moving = np.ones(len(masses), dtype=bool)
+
+    for parent, sons in groups :
+
+        members = np.concatenate(([parent], sons))
+        weights = masses[members,np.newaxis] / masses[members].sum()
+
+        centre = np.sum(weights * positions[members], axis=0)
+        drift = np.sum(weights * velocities[members], axis=0)
+
+        r, u = _universalKepler(positions[sons] - positions[parent], velocities[sons] - velocities[parent], G * (masses[parent] + masses[sons]), dt)
+
+        centre = centre + drift * dt
+        positions[parent] = centre - np.sum(weights[1:] * r, axis=0)
+        velocities[parent] = drift - np.sum(weights[1:] * u, axis=0)
+        positions[sons] = positions[parent] + r
+        velocities[sons] = velocities[parent] + u
+
+        moving[members] = False
+
+    positions[moving] += velocities[moving] * dt
+
+def updateParticlesRungeKutta(particles, stages, masses, dt) : # * Massless particles only feel the massive bodies, stages are the massive positions at each RK4 stage.
+
+    x = particles.positions
+    v = particles.velocities
+    field = _particleField(particles)
+
+    k1x = v
+    k1v = field(x, stages[0], masses)
+
+    k2x = v + k1v * dt/2
+    k2v = field(x + k1x * dt/2, stages[1], masses)
+
+    k3x = v + k2v * dt/2
+    k3v = field(x + k2x * dt/2, stages[2], masses)
+
+    k4x = v + k3v * dt
+    k4v = field(x + k3x * dt, stages[3], masses)
+
+    _advance(particles, dt/6 * (k1x + 2*k2x + 2*k3x + k4x))
+    particles.velocities[:] = v + dt/6 * (k1v + 2*k2v + 2*k3v + k4v)
+    particles.time += dt
+    particles.evaluations += 4 * len(particles)
+
+    particles.sync(trail=False)
+
+def updateSystemRungeKutta(system, dt, acceleration=_accelerations) : # * Same scheme as updateBodiesRungeKutta, every stage is one broadcast over all pairs.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    k1x = v
+    if system.monitor is not None and system.monitor.due(system.steps) :
+        k1v, potentials = acceleration(x, m, potential=True)
+        system.monitor.record(system, potentials, system.steps)
+    else :
+        k1v = acceleration(x, m)
+
+    k2x = v + k1v * dt/2
+    k2v = acceleration(x + k1x * dt/2, m)
+
+    k3x = v + k2v * dt/2
+    k3v = acceleration(x + k2x * dt/2, m)
+
+    k4x = v + k3v * dt
+    k4v = acceleration(x + k3x * dt, m)
+
+    if system.particles is not None :
+        updateParticlesRungeKutta(system.particles, (x, x + k1x * dt/2, x + k2x * dt/2, x + k3x * dt), m, dt)
+
+    _advance(system, dt/6 * (k1x + 2*k2x + 2*k3x + k4x))
+    system.velocities[:] = v + dt/6 * (k1v + 2*k2v + 2*k3v + k4v)
+    system.time += dt
+    system.steps += 1
+    system.accelerations = None
+    system.evaluations += 4 * len(system)
+
+    system.sync()
+
+def _particlesKickDrift(particles, positions, masses, dt) : # Opening half kick and full drift, positions are the massive bodies at the start of the step.
+
+    if particles.accelerations is None :
+        particles.accelerations = _particleField(particles)(particles.positions, positions, masses)
+        particles.evaluations += len(particles)
+
+    particles.velocities += particles.accelerations * dt/2
+    _advance(particles, particles.velocities * dt)
+
+def _particlesKick(particles, positions, masses, dt) : # Closing half kick, positions are the massive bodies at the end of the step.
+
+    particles.accelerations = _particleField(particles)(particles.positions, positions, masses)
+    particles.velocities += particles.accelerations * dt/2
+    particles.time += dt
+    particles.evaluations += len(particles)
+
+    particles.sync(trail=False)
+
+def _openingForces(system, acceleration) : # First force pass of a kick-drift-kick run, also the monitor's starting point.
+
+    if system.monitor is not None and system.monitor.due(system.steps) :
+        system.accelerations, potentials = acceleration(system.positions, system.masses, potential=True)
+        system.monitor.record(system, potentials, system.steps)
+    else :
+        system.accelerations = acceleration(system.positions, system.masses)
+
+    system.evaluations += len(system)
+
+def _closingForces(system, acceleration) : # Last force pass of a kick-drift-kick step, returns the potentials when the monitor samples the step it ends and None otherwise.
+
+    potentials = None
+    if system.monitor is not None and system.monitor.due(system.steps + 1) :
+        system.accelerations, potentials = acceleration(system.positions, system.masses, potential=True)
+    else :
+        system.accelerations = acceleration(system.positions, system.masses)
+
+    system.evaluations += len(system)
+
+    return potentials
+
+def updateSystemLeapfrog(system, dt, acceleration=_accelerations) : # * Kick-drift-kick over the whole system, the closing accelerations open the next step so it costs one force pass.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    if system.accelerations is None :
+        _openingForces(system, acceleration)
+
+    if system.particles is not None :
+        _particlesKickDrift(system.particles, x, m, dt)
+
+    v += system.accelerations * dt/2
+    _advance(system, v * dt)
+
+    potentials = _closingForces(system, acceleration)
+
+    v += system.accelerations * dt/2
+
+    if system.particles is not None :
+        _particlesKick(system.particles, x, m, dt)
+
+    system.time += dt
+    system.steps += 1
+
+    if potentials is not None :
+        system.monitor.record(system, potentials, system.steps)
+
+    system.sync()
+
+def updateSystemKepler(system, dt, acceleration=_accelerations) : # * Kick-drift-kick with the moons drifting along exact orbits about their planet, so the step only has to resolve what perturbs those orbits.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    if system.accelerations is None :
+        _openingForces(system, acceleration)
+
+    if system.particles is not None :
+        _particlesKickDrift(system.particles, x, m, dt)
+
+    v += (system.accelerations + _keplerKick(x, m, system.groups)) * dt/2
+    _satelliteDrift(x, v, m, system.groups, dt)
+
+    potentials = _closingForces(system, acceleration)
+
+    v += (system.accelerations + _keplerKick(x, m, system.groups)) * dt/2
+
+    if system.particles is not None :
+        _particlesKick(system.particles, x, m, dt)
+
+    system.time += dt
+    system.steps += 1
+
+    if potentials is not None :
+        system.monitor.record(system, potentials, system.steps)
+
+    system.sync()
+
+def _hierarchy(system) : # Central body (the heaviest), bodies orbiting it alone, and the moon groups that orbit it as one centre of mass.
+
+    central = int(np.argmax(system.masses))
+    groups = [(parent, sons) for parent, sons in system.groups if parent != central and central not in sons]
+
+    grouped = np.zeros(len(system), dtype=bool)
+    grouped[central] = True
+    for parent, sons in groups :
+        grouped[parent] = True
+        grouped[sons] = True
+
+    return central, np.flatnonzero(~grouped), groups
+
+def _centres(values, masses, lone, groups) : # Per satellite of the central body, a moon group counting as its mass-weighted mean.
+
+    centres = [values[lone]]
+
+    for parent, sons in groups :
+        members = np.concatenate(([parent], sons))
+        centres.append(np.sum(masses[members,np.newaxis] * values[members], axis=0, keepdims=True) / masses[members].sum())
+
+    return np.concatenate(centres)
+
+def _democraticSplit(system, central, lone, groups) : # * Democratic heliocentric state, positions relative to the central body and velocities relative to the barycentre. Moons keep their offset from the planet.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    barycentre = np.sum(m[:,np.newaxis] * x, axis=0) / m.sum()
+    drift = np.sum(m[:,np.newaxis] * v, axis=0) / m.sum()
+
+    masses = np.concatenate((m[lone], [m[parent] + m[sons].sum() for parent, sons in groups]))
+    Q = _centres(x, m, lone, groups) - x[central]
+    U = _centres(v, m, lone, groups) - drift
+
+    moons = [(x[sons] - x[parent], v[sons] - v[parent]) for parent, sons in groups]
+
+    return barycentre, drift, masses, Q, U, moons
+
+def _democraticJoin(system, central, lone, groups, barycentre, drift, masses, Q, U, moons, positions=True) : # Inverse of _democraticSplit, the central body takes whatever keeps the barycentre and total momentum where they were.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    v[central] = drift - np.sum(masses[:,np.newaxis] * U, axis=0) / m[central]
+    V = drift + U
+
+    if positions :
+        x[central] = barycentre - np.sum(masses[:,np.newaxis] * Q, axis=0) / m.sum()
+        X = x[central] + Q
+
+    n = len(lone)
+    v[lone] = V[:n]
+    if positions :
+        x[lone] = X[:n]
+
+    for k,(parent, sons) in enumerate(groups) :
+
+        r, u = moons[k]
+        weights = m[sons,np.newaxis] / (m[parent] + m[sons].sum())
+
+        v[parent] = V[n+k] - np.sum(weights * u, axis=0)
+        v[sons] = v[parent] + u
+
+        if positions :
+            x[parent] = X[n+k] - np.sum(weights * r, axis=0)
+            x[sons] = x[parent] + r
+
+def _democraticKick(system, central, lone, groups, dt) : # Everything but the central body's pull on its satellites and each planet's pull on its moons, those belong to the drifts.
+
+    a = system.accelerations
+    m = system.masses
+    mu = G * m[central]
+
+    barycentre, drift, masses, Q, U, moons = _democraticSplit(system, central, lone, groups)
+
+    U += (_centres(a, m, lone, groups) + mu * Q / np.linalg.norm(Q, axis=1)[:,np.newaxis]**3) * dt
+
+    for k,(parent, sons) in enumerate(groups) :
+        r, u = moons[k]
+        u += (a[sons] - a[parent] + G * (m[parent] + m[sons])[:,np.newaxis] * r / np.linalg.norm(r, axis=1)[:,np.newaxis]**3) * dt
+
+    _democraticJoin(system, central, lone, groups, barycentre, drift, masses, Q, U, moons, positions=False)
+
+    particles = system.particles
+    if particles is not None :
+        q = particles.positions - system.positions[central]
+        particles.velocities += (particles.accelerations + mu * q / np.linalg.norm(q, axis=1)[:,np.newaxis]**3) * dt
+
+def _democraticDrift(system, central, lone, groups, dt) : # Half jump, Kepler drift about the central body (and of every moon about its planet), half jump. All the orbits go through one _universalKepler call.
+
+    m = system.masses
+    mu = G * m[central]
+    start = system.positions[central].copy()
+
+    barycentre, drift, masses, Q, U, moons = _democraticSplit(system, central, lone, groups)
+    jump = np.sum(masses[:,np.newaxis] * U, axis=0) / m[central] # the central body's recoil velocity, shared by every satellite
+
+    particles = system.particles
+    if particles is None :
+        q = u = np.zeros((0,3))
+    else :
+        q = particles.positions - start
+        u = particles.velocities - drift
+
+    r = np.concatenate([Q + jump * dt/2] + [moon[0] for moon in moons] + [q + jump * dt/2])
+    w = np.concatenate([U] + [moon[1] for moon in moons] + [u])
+    mus = np.concatenate([np.full(len(Q), mu)] + [G * (m[parent] + m[sons]) for parent, sons in groups] + [np.full(len(q), mu)])
+
+    r, w = _universalKepler(r, w, mus, dt)
+
+    bounds = np.cumsum([len(Q)] + [len(sons) for parent, sons in groups])
+    U = w[:bounds[0]]
+    jump = np.sum(masses[:,np.newaxis] * U, axis=0) / m[central] # momenta turned during the drift
+    Q = r[:bounds[0]] + jump * dt/2
+    moons = [(r[low:high], w[low:high]) for low, high in zip(bounds[:-1], bounds[1:])]
+
+    _democraticJoin(system, central, lone, groups, barycentre + drift * dt, drift, masses, Q, U, moons)
+
+    if particles is not None :
+        particles.positions[:] = system.positions[central] + r[bounds[-1]:] + jump * dt/2
+        particles.velocities[:] = drift + w[bounds[-1]:]
+
+def updateSystemWisdomHolman(system, dt, acceleration=_accelerations) : # * Wisdom-Holman map in democratic heliocentric coordinates, planets and asteroids drift along exact Kepler orbits about the sun and moons about their planet, the kicks only carry the mutual perturbations.
+
+    x = system.positions
+    m = system.masses
+
+    central, lone, groups = _hierarchy(system)
+
+    if system.accelerations is None :
+        _openingForces(system, acceleration)
+
+    particles = system.particles
+    if particles is not None and particles.accelerations is None :
+        particles.accelerations = _particleField(particles)(particles.positions, x, m)
+        particles.evaluations += len(particles)
+
+    _democraticKick(system, central, lone, groups, dt/2)
+    _democraticDrift(system, central, lone, groups, dt)
+
+    potentials = _closingForces(system, acceleration)
+
+    if particles is not None :
+        particles.accelerations = _particleField(particles)(particles.positions, x, m)
+        particles.evaluations += len(particles)
+
+    _democraticKick(system, central, lone, groups, dt/2)
+
+    system.time += dt
+    system.steps += 1
+
+    if particles is not None :
+        particles.time += dt
+        particles.sync(trail=False)
+
+    if potentials is not None :
+        system.monitor.record(system, potentials, system.steps)
+
+    system.sync()
+
+def updateSystemBlockTimestep(system, dt, acceleration=_accelerations, eta=ETA, max_level=MAX_LEVEL) : # * Kick-drift-kick on power-of-two block steps, only bodies finishing a step get new forces.
+
+    x = system.positions
+    v = system.velocities
+    m = system.masses
+
+    if system.accelerations is None :
+        _openingForces(system, acceleration)
+    a = system.accelerations
+
+    levels = _levels(_nearTimescales(x, m), dt, eta, max_level)
+    system.levels = levels
+
+    deepest = levels.max() if len(levels) else 0
+    h = dt / 2**deepest
+    stride = 2 ** (deepest - levels)
+    steps = (stride * h)[:,np.newaxis]
+
+    if system.particles is not None :
+        _particlesKickDrift(system.particles, x, m, dt) # particles sit on the top level, one kick-drift-kick over the whole block
+
+    monitored = system.monitor is not None and system.monitor.due(system.steps + 1)
+
+    for k in range(2**deepest) :
+
+        starting = k % stride == 0
+        v[starting] += a[starting] * steps[starting] / 2
+
+        _advance(system, v * h)
+
+        ending = (k+1) % stride == 0
+        if monitored and k == 2**deepest - 1 : # everyone finishes on the last substep
+            a[ending], potentials = acceleration(x, m, ending, potential=True)
+        else :
+            a[ending] = acceleration(x, m, ending)
+        v[ending] += a[ending] * steps[ending] / 2
+
+        system.evaluations += np.count_nonzero(ending)
+
+    if system.particles is not None :
+        _particlesKick(system.particles, x, m, dt)
+
+    system.time += dt
+    system.steps += 1
+
+    if monitored :
+        system.monitor.record(system, potentials, system.steps)
+
+    system.sync()
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class System : # * Structure-of-arrays state, row i belongs to bodies[i] and the bodies read and write it through their handles. Massless particles ride along in their own System.
+
+    def __init__(self, bodies, particles=None) :
+
+        self.bodies = bodies
+
+        self.positions = np.array([body.position for body in bodies], dtype=np.float64).reshape(-1,3)
+        self.velocities = np.array([body.velocity for body in bodies], dtype=np.float64).reshape(-1,3)
+        self.masses = np.array([body.mass for body in bodies], dtype=np.float64)
+
+        self.time = 0
+        self.steps = 0
+        self.monitor = None # monitor.Monitor, fed the potentials from the force pass every few steps
+        self.accelerations = None # end-of-step accelerations kept by the kick-drift-kick integrators
+        self.levels = np.zeros(len(self.masses), dtype=int)
+        self.evaluations = 0 # per-body force evaluations so far
+        self.groups = _groups([body.name for body in bodies], [body.parents[0] for body in bodies]) # moons around their planet, for updateSystemKepler
+        self.work = {} # (N,3) scratch for the per-Body integrators in main.py, made on first use
+
+        self.compensated = False # Kahan-summed position updates in the rk4, leapfrog and block integrators
+        self.carry = None # low bits the last compensated update could not add
+        self.single = False # particles only, feel the massive bodies through the float32 _fieldSingle
+
+        self.linked = True # False skips the trails, for runs nobody is watching
+
+        self.particles = None
+        if particles is not None :
+            self.particles = System(particles)
+
+        self.bind()
+
+    @classmethod
+    def from_arrays(cls, positions, velocities, masses) : # Bare state with no Body objects behind it.
+
+        system = cls([])
+        system.positions = np.array(positions, dtype=np.float64).reshape(-1,3)
+        system.velocities = np.array(velocities, dtype=np.float64).reshape(-1,3)
+        system.masses = np.array(masses, dtype=np.float64)
+        system.levels = np.zeros(len(system.masses), dtype=int)
+        system.groups = []
+
+        return system
+
+    def __len__(self) :
+        return len(self.masses)
+
+    def bind(self) : # Points every body at its row, again whenever rows are added or removed.
+
+        for i,body in enumerate(self.bodies) :
+            body.system = self
+            body.index = i
+
+    def sync(self, trail=True) : # Bodies already see the arrays, this only pushes the new positions onto their trails.
+
+        if not self.linked or not trail :
+            return
+
+        for body, point in zip(self.bodies, self.positions[:,:2]) :
+            body.orbit_points.append(point)
+
+INTEGRATORS = {
+    'rk4' : updateSystemRungeKutta,
+    'leapfrog' : updateSystemLeapfrog,
+    'block' : updateSystemBlockTimestep,
+    'kepler' : updateSystemKepler,
+    'wh' : updateSystemWisdomHolman,
+}
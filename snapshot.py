@@ -0,0 +1,226 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import json
+import os
+
+import numpy as np
+
+from physics import System
+
+# Setup Constants ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+MAGIC = b'NSTRAJ1\0'
+PREAMBLE = 24       # magic, frame count, header length
+ALIGN = 64          # frames start on a 64 byte boundary
+GROW = 1024         # frames added to the file each time it fills up
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def _arrays(system, prefix='') :
+
+    arrays = {
+        prefix + 'positions' : system.positions,
+        prefix + 'velocities' : system.velocities,
+        prefix + 'masses' : system.masses,
+        prefix + 'levels' : system.levels,
+        prefix + 'counters' : np.array([system.time, system.steps, system.evaluations], dtype=np.float64),
+    }
+
+    if system.accelerations is not None :
+        arrays[prefix + 'accelerations'] = system.accelerations
+
+    if system.carry is not None :
+        arrays[prefix + 'carry'] = system.carry
+
+    return arrays
+
+def _restore(system, data, prefix='') :
+
+    if len(data[prefix + 'masses']) != len(system) :
+        raise ValueError(f"checkpoint holds {len(data[prefix + 'masses'])} {prefix or 'bodies'} , the system has {len(system)}")
+
+    system.positions[:] = data[prefix + 'positions']
+    system.velocities[:] = data[prefix + 'velocities']
+    system.masses[:] = data[prefix + 'masses']
+    system.levels = data[prefix + 'levels'].copy()
+    system.time, system.steps, system.evaluations = data[prefix + 'counters'].tolist()
+    system.steps = int(system.steps)
+    system.evaluations = int(system.evaluations)
+
+    system.accelerations = None
+    if prefix + 'accelerations' in data :
+        system.accelerations = data[prefix + 'accelerations'].copy()
+
+    system.carry = None # whatever the old trajectory had left over does not belong to these positions
+    if prefix + 'carry' in data :
+        system.carry = data[prefix + 'carry'].copy()
+
+def save_checkpoint(path, system) : # * Whole state to one .npz, written beside the target and renamed so a crash never leaves half a file.
+
+    arrays = _arrays(system)
+    if len(system.bodies) == len(system) :
+        arrays['names'] = np.array([body.name for body in system.bodies], dtype=str)
+
+    if system.particles is not None :
+        arrays.update(_arrays(system.particles, 'particle_'))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file :
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+def load_checkpoint(path, system=None) : # * Restores into system in place (built by init(), same bodies) or returns a bare System.
+
+    with np.load(path) as data :
+
+        data = dict(data)
+
+        if system is None :
+            system = System.from_arrays(data['positions'], data['velocities'], data['masses'])
+            if 'particle_masses' in data :
+                system.particles = System.from_arrays(data['particle_positions'], data['particle_velocities'], data['particle_masses'])
+
+        _restore(system, data)
+
+        if system.particles is not None and 'particle_masses' in data :
+            _restore(system.particles, data, 'particle_')
+
+    system.sync(trail=False)
+    if system.particles is not None :
+        system.particles.sync(trail=False)
+
+    return system
+
+# Setup Classes -----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+class TrajectoryWriter : # * Appends frames (time then every position) to a memory-mapped file, the frame count in the preamble is only bumped once a frame is on disk.
+
+    def __init__(self, path, system, every=1, metadata=None, append=False) : # append picks up an existing file where system.time left it
+
+        self.path = path
+        self.every = every
+        self.bodies = len(system)
+        self.particles = 0 if system.particles is None else len(system.particles)
+        self.frame_size = 1 + 3 * (self.bodies + self.particles)
+
+        if append and os.path.exists(path) :
+            self._reopen(system)
+            return
+
+        header = {
+            'bodies' : self.bodies,
+            'particles' : self.particles,
+            'frame_size' : self.frame_size,
+            'every' : every,
+        }
+        if len(system.bodies) == self.bodies :
+            header['names'] = [body.name for body in system.bodies]
+        header.update(metadata or {})
+
+        header = json.dumps(header).encode()
+        self.offset = -(-(PREAMBLE + len(header)) // ALIGN) * ALIGN
+
+        with open(path, 'wb') as file :
+            file.write(MAGIC)
+            file.write(np.array([0, len(header)], dtype=np.uint64).tobytes())
+            file.write(header)
+            file.write(b'\0' * (self.offset - PREAMBLE - len(header)))
+
+        self.count = 0
+        self.capacity = 0
+        self.frames = None
+        self._grow()
+
+    def _reopen(self, system) : # Keeps the frames up to system.time, anything recorded after the checkpoint is dropped and overwritten.
+
+        existing = Trajectory(self.path)
+        for name in ('bodies', 'particles', 'frame_size') :
+            if existing.header[name] != getattr(self, name) :
+                raise ValueError(f"{self.path} was recorded with {name} {existing.header[name]} , the system has {getattr(self, name)}")
+
+        self.offset = existing.offset
+        self.count = int(np.searchsorted(existing.frames[:,0], system.time, side='right'))
+        self.capacity = len(existing)
+        del existing
+
+        self.frames = None
+        self._grow()
+        self.flush()
+
+    def last(self) : # Time of the newest frame, None while the file is empty.
+        return float(self.frames[self.count - 1, 0]) if self.count else None
+
+    def _grow(self) :
+
+        if self.frames is not None :
+            self.flush()
+            del self.frames
+
+        self.capacity += GROW
+        with open(self.path, 'r+b') as file :
+            file.truncate(self.offset + self.capacity * self.frame_size * 8)
+
+        self.frames = np.memmap(self.path, dtype=np.float64, mode='r+', offset=self.offset, shape=(self.capacity, self.frame_size))
+
+    def append(self, system) :
+
+        if self.count == self.capacity :
+            self._grow()
+
+        frame = self.frames[self.count]
+        frame[0] = system.time
+        frame[1:1 + 3*self.bodies] = system.positions.ravel()
+        if self.particles :
+            frame[1 + 3*self.bodies:] = system.particles.positions.ravel()
+
+        self.count += 1
+
+    def record(self, system) : # append() every few steps.
+
+        if system.steps % self.every == 0 :
+            self.append(system)
+
+    def flush(self) :
+
+        self.frames.flush()
+        with open(self.path, 'r+b') as file :
+            file.seek(len(MAGIC))
+            file.write(np.array([self.count], dtype=np.uint64).tobytes())
+
+    def close(self) :
+
+        self.flush()
+        del self.frames
+        self.frames = None
+
+        with open(self.path, 'r+b') as file :
+            file.truncate(self.offset + self.count * self.frame_size * 8)
+
+class Trajectory : # * Read-only view of a trajectory file, frames are paged in from disk only when touched.
+
+    def __init__(self, path) :
+
+        with open(path, 'rb') as file :
+
+            if file.read(len(MAGIC)) != MAGIC :
+                raise ValueError(f'{path} is not a trajectory file')
+
+            count, length = np.frombuffer(file.read(PREAMBLE - len(MAGIC)), dtype=np.uint64).tolist()
+            self.header = json.loads(file.read(length))
+
+        self.bodies = self.header['bodies']
+        self.particles = self.header['particles']
+        self.offset = -(-(PREAMBLE + length) // ALIGN) * ALIGN
+
+        if count == 0 :
+            self.frames = np.zeros((0, self.header['frame_size']))
+        else :
+            self.frames = np.memmap(path, dtype=np.float64, mode='r', offset=self.offset, shape=(count, self.header['frame_size']))
+
+    def __len__(self) :
+        return len(self.frames)
+
+    def time(self, i) :
+        return self.frames[i,0]
+
+    def positions(self, i) :
+        return self.frames[i,1:1 + 3*self.bodies].reshape(-1,3)
+
+    def particle_positions(self, i) :
+        return self.frames[i,1 + 3*self.bodies:].reshape(-1,3)
@@ -0,0 +1,42 @@
+# Setup Modules ------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from main import Trail
+
+# Setup Functions ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+def check_clear_then_append() : # A trail cleared part way round its ring (F9 load, replay scrub) must only draw the points appended after the clear.
+
+    trail = Trail(capacity=10)
+
+    for k in range(7) :
+        trail.append((k * 1e9, 0))
+    trail.simplified(1e-9, spacing=1)
+
+    trail.clear()
+    for k in range(3) :
+        trail.append((0, k * 1e9))
+
+    assert np.array_equal(trail.simplified(1e-9, spacing=1), trail.ordered() * 1e-9), trail.simplified(1e-9, spacing=1)
+
+def check_wrap() : # Decimating a point at a time has to agree with a fresh pass once the ring has lapped.
+
+    trail = Trail(capacity=10)
+    fresh = Trail(capacity=10)
+
+    for k in range(25) :
+        trail.append((k * 1e9, 0))
+        fresh.append((k * 1e9, 0))
+        trail.simplified(1e-9, spacing=1)
+
+    assert np.array_equal(trail.simplified(1e-9, spacing=1), fresh.simplified(1e-9, spacing=1))
+
+# Main --------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------#
+if __name__ == '__main__' :
+
+    check_clear_then_append()
+    check_wrap()
+    print('trails ok')